@@ -20,7 +20,8 @@ Requires:       python3-requests
 Requires:       python3-pillow
 Requires:       python3-beautifulsoup4
 Requires:       python3-setproctitle
-Requires:       python3-tldextract
+# Brings running web apps to the front instead of starting them again
+Recommends:     xdotool
 
 %description
 Run websites as if they were apps. This is a Qt version of the Linux Mint webapp-manager
@@ -53,6 +54,8 @@ install -m 755 usr/bin/webapp-manager %{buildroot}%{_bindir}/
 # Install Python modules
 install -m 644 usr/lib/webapp-manager/common.py %{buildroot}%{_prefix}/lib/%{name}/
 install -m 755 usr/lib/webapp-manager/webapp-manager.py %{buildroot}%{_prefix}/lib/%{name}/
+install -m 755 usr/lib/webapp-manager/cli.py %{buildroot}%{_prefix}/lib/%{name}/
+install -m 755 usr/lib/webapp-manager/volatile-profile.py %{buildroot}%{_prefix}/lib/%{name}/
 
 # Install desktop file
 desktop-file-install --dir=%{buildroot}%{_datadir}/applications \
@@ -68,6 +71,10 @@ install -m 644 usr/share/webapp-manager/firefox/profile/user.js \
 install -m 644 usr/share/webapp-manager/firefox/profile/chrome/userChrome.css \
     %{buildroot}%{_datadir}/%{name}/firefox/profile/chrome/
 
+# Install the public suffix list snapshot
+install -m 644 usr/share/webapp-manager/public-suffixes.json \
+    %{buildroot}%{_datadir}/%{name}/
+
 # Install icons
 for size in scalable; do
     if [ -d usr/share/icons/hicolor/$size/apps ]; then
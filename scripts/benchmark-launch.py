@@ -0,0 +1,74 @@
+#!/usr/bin/python3
+# Launch latency benchmark.
+#
+# Compares LaunchEngine (Exec split into argv, posix_spawnp) with the
+# previous subprocess.Popen(exec, shell=True). The launched command is
+# `true` with the arguments of a Chromium webapp, so the time measured is
+# the launch itself, not the browser:
+#   - spawn: from the launch call until it returns with a PID
+#   - exited: from the launch call until the command has run and exited
+#     (with a shell in between, it starts once /bin/sh has parsed the line)
+#
+# Usage:
+#   python3 scripts/benchmark-launch.py [--rounds 200]
+
+#   1. Standard library imports.
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "usr", "lib", "webapp-manager"))
+
+#   3. Local application/library specific imports.
+from common import LaunchEngine
+
+EXEC = ('true --app="https://example.com/login?next=/inbox" --class=WebApp-Bench1234 --name=WebApp-Bench1234'
+        ' --user-data-dir=/tmp/ice/profiles/Bench1234')
+
+
+class BenchmarkWebApp:
+    codename = "Bench1234"
+    name = "Benchmark"
+    icon = "webapp-manager"
+    path = "/tmp/WebApp-Bench1234.desktop"
+    exec = EXEC
+
+
+def time_shell():
+    start = time.perf_counter()
+    process = subprocess.Popen(EXEC, shell=True)
+    spawned = time.perf_counter()
+    process.wait()
+    return spawned - start, time.perf_counter() - start
+
+
+def time_engine(engine):
+    start = time.perf_counter()
+    launch = engine.launch(BenchmarkWebApp)
+    spawned = time.perf_counter()
+    os.waitpid(launch.pid, 0)
+    exited = time.perf_counter()
+    # Forgets the child and closes its pidfd
+    engine.reap()
+    return spawned - start, exited - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the latency of launching a webapp")
+    parser.add_argument("--rounds", type=int, default=200, help="launches per method (the median is reported)")
+    args = parser.parse_args()
+
+    engine = LaunchEngine()
+    print("%-24s %12s %12s" % ("method", "spawn ms", "exited ms"))
+    for label, measure in (("Popen(shell=True)", time_shell), ("LaunchEngine", lambda: time_engine(engine))):
+        results = [measure() for _round in range(args.rounds)]
+        print("%-24s %12.3f %12.3f" % (label,
+                                       statistics.median(spawn for spawn, _exited in results) * 1000,
+                                       statistics.median(exited for _spawn, exited in results) * 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/python3
+# Micro-benchmark of the desktop entry parser.
+#
+# Compares WebAppLauncher with the previous substring-matching parser:
+# parse time per 1,000 launchers and memory per parsed record.
+#
+# Usage:
+#   python3 scripts/benchmark-launchers.py [--count 1000] [--rounds 5]
+
+#   1. Standard library imports.
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "usr", "lib", "webapp-manager"))
+
+#   3. Local application/library specific imports.
+from common import WebAppLauncher, _
+
+LAUNCHER_TEMPLATE = """[Desktop Entry]
+Version=1.0
+Name=Benchmark App {index}
+GenericName=Benchmark
+Comment=Web App
+Exec=chromium --app="https://example{index}.com" --class=WebApp-Bench{index} --name=WebApp-Bench{index} --user-data-dir=/tmp/profiles/Bench{index}
+Terminal=false
+X-MultipleArgs=false
+Type=Application
+Icon=/tmp/icons/Bench{index}.png
+Categories=GTK;Network;
+MimeType=text/html;text/xml;application/xhtml_xml;
+StartupWMClass=WebApp-Bench{index}
+StartupNotify=true
+X-WebApp-Browser=Chromium
+X-WebApp-URL=https://example{index}.com
+X-WebApp-CustomParameters=
+X-WebApp-Navbar=false
+X-WebApp-PrivateWindow=false
+X-WebApp-Isolated=true
+"""
+
+
+# The parser WebAppLauncher used before the table-driven one, kept here as the baseline.
+class LegacyWebAppLauncher:
+
+    def __init__(self, path, codename):
+        self.path = path
+        self.codename = codename
+        self.web_browser = None
+        self.name = None
+        self.desc = None
+        self.icon = None
+        self.is_valid = False
+        self.exec = None
+        self.category = None
+        self.url = ""
+        self.custom_parameters = ""
+        self.isolate_profile = False
+        self.navbar = False
+        self.privatewindow = False
+
+        is_webapp = False
+        with open(path) as desktop_file:
+            for line in desktop_file:
+                line = line.strip()
+
+                if "StartupWMClass=WebApp" in line or "StartupWMClass=Chromium" in line or "StartupWMClass=ICE-SSB" in line:
+                    is_webapp = True
+                    continue
+
+                if "Name=" in line:
+                    self.name = line.replace("Name=", "")
+                    continue
+
+                if "Comment=" in line:
+                    self.desc = line.replace("Comment=", "")
+                    if self.desc == _("Web App"):
+                        self.desc = ""
+                    continue
+
+                if "Icon=" in line:
+                    self.icon = line.replace("Icon=", "")
+                    continue
+
+                if "Exec=" in line:
+                    self.exec = line.replace("Exec=", "")
+                    continue
+
+                if "Categories=" in line:
+                    self.category = line.replace("Categories=", "").replace("GTK;", "").replace(";", "")
+                    continue
+
+                if "X-WebApp-Browser=" in line:
+                    self.web_browser = line.replace("X-WebApp-Browser=", "")
+                    continue
+
+                if "X-WebApp-URL=" in line:
+                    self.url = line.replace("X-WebApp-URL=", "")
+                    continue
+
+                if "X-WebApp-CustomParameters" in line:
+                    self.custom_parameters = line.replace("X-WebApp-CustomParameters=", "")
+                    continue
+
+                if "X-WebApp-Isolated" in line:
+                    self.isolate_profile = line.replace("X-WebApp-Isolated=", "").lower() == "true"
+                    continue
+
+                if "X-WebApp-Navbar" in line:
+                    self.navbar = line.replace("X-WebApp-Navbar=", "").lower() == "true"
+                    continue
+
+                if "X-WebApp-PrivateWindow" in line:
+                    self.privatewindow = line.replace("X-WebApp-PrivateWindow=", "").lower() == "true"
+                    continue
+
+        if is_webapp and self.name is not None and self.icon is not None:
+            self.is_valid = True
+
+
+def write_launchers(directory, count):
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, "WebApp-Bench%d.desktop" % index)
+        with open(path, "w") as desktop_file:
+            desktop_file.write(LAUNCHER_TEMPLATE.format(index=index))
+        paths.append((path, "Bench%d" % index))
+    return paths
+
+
+def time_parser(parser, paths, rounds):
+    best = None
+    for _round in range(rounds):
+        start = time.perf_counter()
+        for path, codename in paths:
+            parser(path, codename)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best * 1000 / len(paths) * 1000  # ms per 1,000 files
+
+
+def record_memory(parser, paths):
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    records = [parser(path, codename) for path, codename in paths]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(before, "filename"))
+    # The record object itself, without the attribute strings both parsers share
+    container = sys.getsizeof(records[0])
+    if hasattr(records[0], "__dict__"):
+        container += sys.getsizeof(records[0].__dict__)
+    return size / len(records), container
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the desktop entry parser")
+    parser.add_argument("--count", type=int, default=1000, help="number of launchers to generate")
+    parser.add_argument("--rounds", type=int, default=5, help="timing rounds (best is reported)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_launchers(directory, args.count)
+
+        legacy = LegacyWebAppLauncher(*paths[0])
+        current = WebAppLauncher(*paths[0])
+        if legacy.name != current.name:
+            print("Note: the legacy parser reads Name=%r (GenericName overwrote it)" % legacy.name)
+
+        print("%-24s %16s %16s %16s" % ("parser", "ms / 1000 files", "bytes / record", "object bytes"))
+        for label, cls in (("legacy (substring)", LegacyWebAppLauncher), ("table + __slots__", WebAppLauncher)):
+            per_thousand = time_parser(cls, paths, args.rounds)
+            per_record, container = record_memory(cls, paths)
+            print("%-24s %16.2f %16.0f %16d" % (label, per_thousand, per_record, container))
+
+
+if __name__ == "__main__":
+    main()
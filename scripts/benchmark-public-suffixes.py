@@ -0,0 +1,107 @@
+#!/usr/bin/python3
+# Benchmark of the public suffix matcher.
+#
+# Compares PublicSuffixList with tldextract (when installed, run offline
+# from its bundled snapshot): load time in a fresh interpreter, and
+# extraction time per call over a set of URLs.
+#
+# Usage:
+#   python3 scripts/benchmark-public-suffixes.py [--calls 100000] [--runs 5]
+#                                                [--snapshot usr/share/webapp-manager/public-suffixes.json]
+
+#   1. Standard library imports.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+LIB_DIR = os.path.join(ROOT_DIR, "usr", "lib", "webapp-manager")
+
+URLS = (
+    "https://mail.google.com/mail/u/0/",
+    "https://www.youtube.com/watch?v=1",
+    "http://www.bbc.co.uk/news",
+    "https://github.com/linuxmint/webapp-manager",
+    "https://docs.python.org/3/library/",
+    "https://foo.bar.kawasaki.jp",
+    "https://web.whatsapp.com",
+    "https://outlook.office365.com/mail/",
+    "https://www.amazon.com.br",
+    "http://192.168.1.1:8080/",
+    "https://app.example.xn--p1ai",
+    "https://a.b.c.d.example.co.nz/path",
+)
+
+# Each loader runs in a fresh interpreter and prints the load time in seconds
+LOADERS = {
+    "built-in trie": """
+import sys, time
+sys.path.insert(0, {lib_dir!r})
+start = time.perf_counter()
+from common import PublicSuffixList
+PublicSuffixList.load({snapshot!r}).extract("www.example.com")
+print(time.perf_counter() - start)
+""",
+    "tldextract": """
+import time
+start = time.perf_counter()
+import tldextract
+tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)("www.example.com")
+print(time.perf_counter() - start)
+""",
+}
+
+
+def load_time(code, runs):
+    times = []
+    for _run in range(runs):
+        output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+        times.append(float(output.split()[-1]))
+    return statistics.median(times)
+
+
+def call_time(extract, calls):
+    urls = URLS * (calls // len(URLS) + 1)
+    start = time.perf_counter()
+    for url in urls[:calls]:
+        extract(url)
+    return (time.perf_counter() - start) / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the public suffix matcher")
+    parser.add_argument("--calls", type=int, default=100000, help="extractions timed per matcher")
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters started per load measurement (median)")
+    parser.add_argument("--snapshot", default=os.path.join(ROOT_DIR, "usr", "share", "webapp-manager", "public-suffixes.json"),
+                        help="compiled snapshot to load")
+    args = parser.parse_args()
+
+    sys.path.insert(0, LIB_DIR)
+    from common import PublicSuffixList
+    matchers = {"built-in trie": PublicSuffixList.load(args.snapshot).extract}
+    try:
+        import tldextract
+        matchers["tldextract"] = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+    except ImportError:
+        print("tldextract is not installed, only the built-in matcher is measured")
+
+    print("%-16s %14s %14s" % ("matcher", "load ms", "us / call"))
+    for label, extract in matchers.items():
+        code = LOADERS[label].format(lib_dir=LIB_DIR, snapshot=args.snapshot)
+        print("%-16s %14.1f %14.2f" % (label, load_time(code, args.runs) * 1000, call_time(extract, args.calls) * 1000000))
+
+    if "tldextract" in matchers:
+        for url in URLS:
+            ours = tuple(matchers["built-in trie"](url))
+            theirs = matchers["tldextract"](url)
+            theirs = (theirs.subdomain, theirs.domain, theirs.suffix)
+            if ours != theirs:
+                print("differs: %s built-in %s, tldextract %s" % (url, json.dumps(ours), json.dumps(theirs)))
+
+
+if __name__ == "__main__":
+    main()
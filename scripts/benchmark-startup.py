@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+# Startup benchmark of the GUI.
+#
+# Each run starts a fresh interpreter on the offscreen Qt platform, with a
+# throwaway HOME holding generated launchers, and reports:
+#   - import: time to import webapp-manager.py (and common)
+#   - first paint: time from the start of that import to the first paint of the window
+# It also fails when a dependency which should be imported lazily was
+# loaded before the first paint, or when a --max-* budget is exceeded.
+#
+# Usage:
+#   python3 scripts/benchmark-startup.py [--runs 5] [--launchers 100]
+#                                        [--max-import-ms N] [--max-paint-ms N]
+
+#   1. Standard library imports.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+LIB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "usr", "lib", "webapp-manager")
+
+# Modules which are only needed by the favicon and icon chooser paths
+LAZY_MODULES = ("requests", "PIL", "bs4", "PyKDE5", "urllib.request", "concurrent.futures")
+
+LAUNCHER_TEMPLATE = """[Desktop Entry]
+Version=1.0
+Name=Startup App {index}
+Comment=Web App
+Exec=chromium --app="https://example{index}.com" --class=WebApp-Startup{index} --name=WebApp-Startup{index}
+Terminal=false
+Type=Application
+Icon=webapp-manager
+Categories=GTK;Network;
+StartupWMClass=WebApp-Startup{index}
+X-WebApp-Browser=Chromium
+X-WebApp-URL=https://example{index}.com
+X-WebApp-CustomParameters=
+X-WebApp-Navbar=false
+X-WebApp-PrivateWindow=false
+X-WebApp-Isolated=true
+"""
+
+
+def child():
+    # Runs in the measured interpreter, prints one JSON line
+    start = time.perf_counter()
+    import importlib.util
+    sys.path.insert(0, LIB_DIR)
+    spec = importlib.util.spec_from_file_location("webapp_manager", os.path.join(LIB_DIR, "webapp-manager.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    imported = time.perf_counter()
+
+    from PySide6.QtCore import QEvent, QObject, QTimer
+    from PySide6.QtWidgets import QApplication
+
+    class PaintWatcher(QObject):
+        painted = None
+
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and self.painted is None:
+                self.painted = time.perf_counter()
+                loaded = sorted(name for name in LAZY_MODULES if name in sys.modules)
+                print(json.dumps({"import": imported - start, "paint": self.painted - start, "loaded": loaded}))
+                QTimer.singleShot(0, QApplication.instance().quit)
+            return False
+
+    app = QApplication(sys.argv[:1])
+    watcher = PaintWatcher()
+    app.installEventFilter(watcher)
+    window = module.WebAppManagerWindow()
+    window.show()
+    QTimer.singleShot(10000, app.quit)
+    app.exec()
+
+
+def run_once(home):
+    env = dict(os.environ, HOME=home, QT_QPA_PLATFORM="offscreen", XDG_CACHE_HOME=os.path.join(home, ".cache"))
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                            env=env, capture_output=True, text=True, check=True).stdout
+    for line in output.splitlines():
+        if line.startswith("{"):
+            return json.loads(line)
+    raise RuntimeError("The window was never painted:\n%s" % output)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time-to-first-paint of the GUI")
+    parser.add_argument("--runs", type=int, default=5, help="number of measured runs (the median is reported)")
+    parser.add_argument("--launchers", type=int, default=100, help="number of generated launchers")
+    parser.add_argument("--max-import-ms", type=float, help="fail when the median import time is above this")
+    parser.add_argument("--max-paint-ms", type=float, help="fail when the median time to first paint is above this")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    with tempfile.TemporaryDirectory() as home:
+        apps_dir = os.path.join(home, ".local", "share", "applications")
+        os.makedirs(apps_dir)
+        for index in range(args.launchers):
+            with open(os.path.join(apps_dir, "WebApp-Startup%d.desktop" % index), "w") as desktop_file:
+                desktop_file.write(LAUNCHER_TEMPLATE.format(index=index))
+
+        # The first run fills the launcher index, the others start warm
+        cold = run_once(home)
+        results = [run_once(home) for _run in range(args.runs)]
+
+    import_ms = statistics.median(result["import"] for result in results) * 1000
+    paint_ms = statistics.median(result["paint"] for result in results) * 1000
+    print("launchers: %d, runs: %d" % (args.launchers, args.runs))
+    print("cold start:   import %7.1f ms   first paint %7.1f ms" % (cold["import"] * 1000, cold["paint"] * 1000))
+    print("warm median:  import %7.1f ms   first paint %7.1f ms" % (import_ms, paint_ms))
+
+    failed = False
+    loaded = sorted(set(name for result in [cold] + results for name in result["loaded"]))
+    if loaded:
+        print("FAIL: imported before the first paint: %s" % ", ".join(loaded))
+        failed = True
+    if args.max_import_ms is not None and import_ms > args.max_import_ms:
+        print("FAIL: import takes more than %.1f ms" % args.max_import_ms)
+        failed = True
+    if args.max_paint_ms is not None and paint_ms > args.max_paint_ms:
+        print("FAIL: first paint takes more than %.1f ms" % args.max_paint_ms)
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+#!/usr/bin/python3
+# Compiles the public suffix list into the snapshot shipped with the app.
+#
+# Only the ICANN section is kept, see PublicSuffixList in common.py.
+# Run it again and commit the result to update the snapshot.
+#
+# Usage:
+#   python3 scripts/compile-public-suffixes.py [--source public_suffix_list.dat]
+#                                              [--output usr/share/webapp-manager/public-suffixes.json]
+
+#   1. Standard library imports.
+import argparse
+import json
+import os
+import sys
+
+ROOT_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+sys.path.insert(0, os.path.join(ROOT_DIR, "usr", "lib", "webapp-manager"))
+
+#   3. Local application/library specific imports.
+from common import PublicSuffixList, SYSTEM_PUBLIC_SUFFIX_LIST
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the public suffix list snapshot")
+    parser.add_argument("--source", default=SYSTEM_PUBLIC_SUFFIX_LIST, help="public_suffix_list.dat to compile")
+    parser.add_argument("--output", default=os.path.join(ROOT_DIR, "usr", "share", "webapp-manager", "public-suffixes.json"),
+                        help="snapshot to write")
+    args = parser.parse_args()
+
+    with open(args.source, encoding="utf-8") as list_file:
+        trie = PublicSuffixList.compile(list_file.read())
+    snapshot = {
+        "version": PublicSuffixList.VERSION,
+        "license": "Public Suffix List, https://publicsuffix.org/, MPL-2.0",
+        "trie": trie,
+    }
+    with open(args.output, "w", encoding="utf-8") as snapshot_file:
+        json.dump(snapshot, snapshot_file, ensure_ascii=False, separators=(",", ":"), sort_keys=True)
+        snapshot_file.write("\n")
+    print("Wrote %s (%d bytes)" % (args.output, os.path.getsize(args.output)))
+
+
+if __name__ == "__main__":
+    main()
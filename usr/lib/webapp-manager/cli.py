@@ -0,0 +1,287 @@
+#!/usr/bin/python3
+# Command line interface of webapp-manager, for scripts.
+#
+# It only imports common, never Qt, so each call takes a few tens of
+# milliseconds:
+#   webapp-manager list [--json]
+#   webapp-manager browsers [--all] [--json]
+#   webapp-manager create --name NAME --url URL [--browser BROWSER] [options]
+#   webapp-manager edit CODENAME [--name NAME] [--url URL] [options]
+#   webapp-manager delete CODENAME
+#   webapp-manager launch CODENAME (prints the PID, focuses it when already running)
+#   webapp-manager export FILE|- [--include-caches] [CODENAME...]
+#   webapp-manager import FILE|- [--overwrite]
+#   webapp-manager usage [--json] [--refresh]
+#   webapp-manager prune-caches [CODENAME...]
+#   webapp-manager dedup
+
+#   1. Standard library imports.
+import argparse
+import json
+import sys
+
+#   3. Local application/library specific imports.
+from common import CHROMIUM_PRESET_FLAGS, DiskUsageScanner, ProfileDeduplicator, LaunchEngine, WebAppManager, TrashReaper, ACTIVATE_RUNNING, _
+
+CATEGORIES = ("WebApps", "Network", "Utility", "Game", "Graphics", "Office", "AudioVideo", "Development", "Education")
+
+
+class CommandError(Exception):
+    pass
+
+
+def find_webapp(manager, codename):
+    for webapp in manager.get_webapps():
+        if webapp.is_valid and webapp.codename == codename:
+            return webapp
+    raise CommandError(_("No web app named '%s'") % codename)
+
+
+def find_browser(manager, name):
+    # Installed first: the system and user flatpaks of a browser share their name
+    for browsers in (manager.get_installed_browsers(), manager.get_supported_browsers()):
+        for browser in browsers:
+            if browser.name.lower() == name.lower():
+                return browser
+    raise CommandError(_("Unknown browser '%s'") % name)
+
+
+def webapp_record(webapp):
+    record = {"codename": webapp.codename, "path": webapp.path}
+    record.update(webapp.to_record())
+    return record
+
+
+def command_list(manager, args):
+    webapps = sorted((webapp for webapp in manager.get_webapps() if webapp.is_valid), key=lambda webapp: webapp.name.lower())
+    if args.json:
+        json.dump([webapp_record(webapp) for webapp in webapps], sys.stdout, indent=2)
+        print()
+    else:
+        for webapp in webapps:
+            print("%s\t%s\t%s\t%s" % (webapp.codename, webapp.name, webapp.web_browser, webapp.url))
+
+
+def command_browsers(manager, args):
+    browsers = manager.get_supported_browsers() if args.all else manager.get_installed_browsers()
+    if args.json:
+        json.dump([{"name": browser.name, "type": browser.browser_type, "exec_path": browser.exec_path} for browser in browsers],
+                  sys.stdout, indent=2)
+        print()
+    else:
+        for browser in browsers:
+            print(browser.name)
+
+
+def normalize_url(url):
+    if "://" not in url:
+        url = "http://" + url
+    return url
+
+
+def command_create(manager, args):
+    if args.browser:
+        browser = find_browser(manager, args.browser)
+    else:
+        installed = manager.get_installed_browsers()
+        if not installed:
+            raise CommandError(_("No supported browser is installed"))
+        browser = installed[0]
+    codename = manager.create_webapp(args.name, args.desc or "", normalize_url(args.url), args.icon, args.category,
+                                     browser, args.custom_parameters or "", args.isolated, args.navbar, args.private, args.volatile,
+                                     args.preset)
+    print(codename)
+
+
+def command_edit(manager, args):
+    webapp = find_webapp(manager, args.codename)
+    # Launchers without X-WebApp-Browser keep their Exec, only the other fields change
+    browser_name = args.browser or webapp.web_browser
+    browser = find_browser(manager, browser_name) if browser_name else None
+
+    def choose(value, current):
+        return current if value is None else value
+
+    manager.edit_webapp(webapp.path,
+                        choose(args.name, webapp.name),
+                        choose(args.desc, webapp.desc),
+                        browser,
+                        normalize_url(args.url) if args.url is not None else webapp.url,
+                        choose(args.icon, webapp.icon),
+                        choose(args.category, webapp.category),
+                        choose(args.custom_parameters, webapp.custom_parameters),
+                        webapp.codename,
+                        choose(args.isolated, webapp.isolate_profile),
+                        choose(args.navbar, webapp.navbar),
+                        choose(args.private, webapp.privatewindow),
+                        choose(args.volatile, webapp.volatile),
+                        choose(args.preset, webapp.preset))
+
+
+def command_delete(manager, args):
+    manager.delete_webbapp(find_webapp(manager, args.codename))
+    # Scripts expect the space back when the command returns
+    TrashReaper().reap()
+
+
+def command_launch(manager, args):
+    webapp = find_webapp(manager, args.codename)
+    # Detached, the browser outlives this command
+    try:
+        result, launch = LaunchEngine().activate(webapp, quiet=True)
+    except OSError as e:
+        raise CommandError(_("Could not launch '%(name)s': %(error)s") % {"name": webapp.name, "error": e.strerror or e})
+    if result == ACTIVATE_RUNNING:
+        raise CommandError(_("'%s' is already running.") % webapp.name)
+    if launch is not None:
+        print(launch.pid)
+
+
+def command_export(manager, args):
+    webapps = [find_webapp(manager, codename) for codename in args.codenames] if args.codenames else None
+    compression = "xz" if args.file.endswith((".xz", ".txz")) else "gz"
+    if args.file == "-":
+        exported = manager.export_webapps(sys.stdout.buffer, webapps, args.include_caches, compression)
+    else:
+        with open(args.file, "wb") as archive:
+            exported = manager.export_webapps(archive, webapps, args.include_caches, compression)
+    for webapp in exported:
+        print(_("Exported %s") % webapp["codename"], file=sys.stderr)
+
+
+def command_import(manager, args):
+    try:
+        if args.file == "-":
+            restored = manager.import_webapps(sys.stdin.buffer, args.overwrite)
+        else:
+            with open(args.file, "rb") as archive:
+                restored = manager.import_webapps(archive, args.overwrite)
+    except (OSError, ValueError) as e:
+        raise CommandError(e)
+    for webapp in restored:
+        print(_("Imported %s") % webapp["codename"], file=sys.stderr)
+    # Profiles replaced by --overwrite
+    TrashReaper().reap()
+
+
+def command_usage(manager, args):
+    webapps = sorted((webapp for webapp in manager.get_webapps() if webapp.is_valid), key=lambda webapp: webapp.name.lower())
+    usage = DiskUsageScanner().scan([webapp.codename for webapp in webapps], refresh=args.refresh)
+    if args.json:
+        json.dump({webapp.codename: usage[webapp.codename] for webapp in webapps}, sys.stdout, indent=2)
+        print()
+    else:
+        for webapp in webapps:
+            print("%s\t%d" % (webapp.codename, usage[webapp.codename]))
+
+
+def command_prune_caches(manager, args):
+    if args.codenames:
+        webapps = [find_webapp(manager, codename) for codename in args.codenames]
+    else:
+        webapps = [webapp for webapp in manager.get_webapps() if webapp.is_valid]
+    for webapp in webapps:
+        pruned = manager.prune_caches(webapp)
+        if pruned:
+            print(_("Pruned %(count)d cache directories of %(codename)s") % {"count": pruned, "codename": webapp.codename},
+                  file=sys.stderr)
+    reaper = TrashReaper()
+    reaper.reap()
+    print(_("%d bytes freed") % reaper.freed, file=sys.stderr)
+
+
+def command_dedup(manager, args):
+    codenames = [webapp.codename for webapp in manager.get_webapps() if webapp.is_valid]
+    reclaimed = ProfileDeduplicator().run(codenames)
+    print(_("%d bytes reclaimed") % reclaimed, file=sys.stderr)
+
+
+def add_webapp_options(parser, creating):
+    # create gets the defaults of the add page, edit keeps the current values
+    parser.add_argument("--name", required=creating, help=_("Name"))
+    parser.add_argument("--url", required=creating, help=_("Address"))
+    parser.add_argument("--desc", help=_("Description"))
+    parser.add_argument("--icon", default="webapp-manager" if creating else None, help=_("Icon name or path"))
+    parser.add_argument("--category", choices=CATEGORIES, default="WebApps" if creating else None, help=_("Category"))
+    parser.add_argument("--browser", help=_("Browser name, as listed by the browsers command"))
+    parser.add_argument("--custom-parameters", help=_("Custom browser parameters"))
+    parser.add_argument("--isolated", action=argparse.BooleanOptionalAction, default=True if creating else None,
+                        help=_("Isolated browser profile"))
+    parser.add_argument("--navbar", action=argparse.BooleanOptionalAction, default=False if creating else None,
+                        help=_("Navigation bar (Firefox)"))
+    parser.add_argument("--private", action=argparse.BooleanOptionalAction, default=False if creating else None,
+                        help=_("Private/Incognito window"))
+    parser.add_argument("--volatile", action=argparse.BooleanOptionalAction, default=False if creating else None,
+                        help=_("Run the browser profile from memory (Firefox based browsers)"))
+    parser.add_argument("--preset", choices=list(CHROMIUM_PRESET_FLAGS), default="standard" if creating else None,
+                        help=_("Process and cache budgets (Chromium based browsers)"))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="webapp-manager", description=_("Manage web apps without the graphical interface"))
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    list_parser = commands.add_parser("list", help=_("List the web apps"))
+    list_parser.add_argument("--json", action="store_true", help=_("Print JSON"))
+    list_parser.set_defaults(func=command_list)
+
+    browsers_parser = commands.add_parser("browsers", help=_("List the installed browsers"))
+    browsers_parser.add_argument("--all", action="store_true", help=_("List every supported browser"))
+    browsers_parser.add_argument("--json", action="store_true", help=_("Print JSON"))
+    browsers_parser.set_defaults(func=command_browsers)
+
+    create_parser = commands.add_parser("create", help=_("Create a web app and print its codename"))
+    add_webapp_options(create_parser, True)
+    create_parser.set_defaults(func=command_create)
+
+    edit_parser = commands.add_parser("edit", help=_("Edit a web app"))
+    edit_parser.add_argument("codename")
+    add_webapp_options(edit_parser, False)
+    edit_parser.set_defaults(func=command_edit)
+
+    delete_parser = commands.add_parser("delete", help=_("Delete a web app"))
+    delete_parser.add_argument("codename")
+    delete_parser.set_defaults(func=command_delete)
+
+    launch_parser = commands.add_parser("launch", help=_("Launch a web app and print its PID, or bring it to the front when it runs"))
+    launch_parser.add_argument("codename")
+    launch_parser.set_defaults(func=command_launch)
+
+    export_parser = commands.add_parser("export", help=_("Write web apps and their profiles to a backup archive"))
+    export_parser.add_argument("file", help=_("Archive to write, .tar.gz or .tar.xz, - for the standard output"))
+    export_parser.add_argument("codenames", nargs="*", metavar="codename", help=_("Web apps to export, all by default"))
+    export_parser.add_argument("--include-caches", action="store_true", help=_("Also export the browser caches"))
+    export_parser.set_defaults(func=command_export)
+
+    import_parser = commands.add_parser("import", help=_("Restore web apps from a backup archive"))
+    import_parser.add_argument("file", help=_("Archive to read, - for the standard input"))
+    import_parser.add_argument("--overwrite", action="store_true", help=_("Replace web apps which already exist"))
+    import_parser.set_defaults(func=command_import)
+
+    usage_parser = commands.add_parser("usage", help=_("Print the disk space used by the profile of each web app, in bytes"))
+    usage_parser.add_argument("--json", action="store_true", help=_("Print JSON"))
+    usage_parser.add_argument("--refresh", action="store_true", help=_("Measure every directory again, not only the changed ones"))
+    usage_parser.set_defaults(func=command_usage)
+
+    prune_parser = commands.add_parser("prune-caches", help=_("Remove the browser caches of web apps"))
+    prune_parser.add_argument("codenames", nargs="*", metavar="codename", help=_("Web apps to prune, all by default"))
+    prune_parser.set_defaults(func=command_prune_caches)
+
+    dedup_parser = commands.add_parser("dedup", help=_("Share identical files between the web app profiles"))
+    dedup_parser.set_defaults(func=command_dedup)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        args.func(WebAppManager(), args)
+    except CommandError as e:
+        print("webapp-manager: %s" % e, file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
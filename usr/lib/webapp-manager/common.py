@@ -1,27 +1,33 @@
 #!/usr/bin/python3
 
 #   1. Standard library imports.
+import collections
 import configparser
+import errno
+import fcntl
 import gettext
-from io import BytesIO
+import hashlib
+import io
+import json
 import locale
 import os
 from random import choice
+import re
 import shutil
 import string
 import sys
-import tempfile
-import urllib.error
 import urllib.parse
-import urllib.request
 import threading
+import time
 import traceback
-from typing import Optional
+from typing import Optional, TYPE_CHECKING
 
 #   2. Related third party imports.
-import PIL.Image
-import requests
-# Note: BeautifulSoup is an optional import supporting another way of getting a website's favicons.
+# Note: requests, PIL and BeautifulSoup are only imported by the favicon
+# functions, so listing and editing webapps does not pay for loading them.
+if TYPE_CHECKING:
+    import PIL.Image
+    import requests
 
 
 # Used as a decorator to run things in the background
@@ -82,7 +88,86 @@ EPIPHANY_PROFILES_DIR = os.path.join(ICE_DIR, "epiphany")
 FALKON_PROFILES_DIR = os.path.join(ICE_DIR, "falkon")
 ZEN_FLATPAK_PROFILES_DIR = os.path.expanduser("~/.var/app/app.zen_browser.zen/data/ice/zen/")
 ICONS_DIR = os.path.join(ICE_DIR, "icons")
+TRASH_DIR = os.path.join(ICE_DIR, "trash")
+CACHE_DIR = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "webapp-manager")
+FAVICON_CACHE_DIR = os.path.join(CACHE_DIR, "favicons")
+BROWSERS_CACHE_PATH = os.path.join(CACHE_DIR, "browsers.json")
+DISK_USAGE_CACHE_PATH = os.path.join(CACHE_DIR, "disk-usage.json")
+DEDUP_CACHE_PATH = os.path.join(CACHE_DIR, "profile-hashes.json")
+DEDUP_MIN_SIZE = 64 * 1024  # smaller profile files are not worth deduplicating
+SYSTEM_FLATPAK_BIN_DIR = "/var/lib/flatpak/exports/bin"
+USER_FLATPAK_BIN_DIR = os.path.expanduser("~/.local/share/flatpak/exports/bin")
+LAUNCHER_INDEX_PATH = os.path.join(ICE_DIR, "launchers.json")
+FAVICON_DEADLINE = 10  # seconds allowed for a whole favicon search
+FAVICON_WORKERS = 6  # concurrent favicon candidate downloads
+IMAGE_TIMEOUT = 3  # seconds allowed per request
+HTTP_POOL_HOSTS = 16  # hosts kept in the HTTP connection pool
+HTTP_POOL_PER_HOST = 4  # concurrent connections to a single host
+PAGE_MAX_BYTES = 2 * 1024 * 1024  # biggest web page read when looking for icons
+IMAGE_MAX_BYTES = 1024 * 1024  # biggest icon candidate downloaded
+FAVICON_MAX_SIZE = 256  # icons are scaled down to fit in this many pixels
+FAVICON_CACHE_MAX_BYTES = 32 * 1024 * 1024  # disk budget of the favicon cache
+FAVICON_CACHE_DEFAULT_TTL = 24 * 60 * 60  # seconds, when the server gives no expiry
+FIREFOX_TEMPLATE_DIR = "/usr/share/webapp-manager/firefox"
+FIREFOX_PROFILE_TEMPLATE = os.path.join(FIREFOX_TEMPLATE_DIR, "profile")
+FIREFOX_NAVBAR_CSS = os.path.join(FIREFOX_TEMPLATE_DIR, "userChrome-with-navbar.css")
+FIREFOX_PROFILE_STAMP = ".webapp-manager-profile"
+VOLATILE_WRAPPER = "/usr/lib/webapp-manager/volatile-profile.py"
+VOLATILE_MARKER = ".webapp-manager-volatile"  # locked in a profile on disk while its copy in memory is used
+VOLATILE_SYNC_INTERVAL = 10 * 60  # seconds between syncs of a profile in memory back to disk
+PUBLIC_SUFFIX_PATH = "/usr/share/webapp-manager/public-suffixes.json"
+SYSTEM_PUBLIC_SUFFIX_LIST = "/usr/share/publicsuffix/public_suffix_list.dat"
+ICON_INDEX_PATH = os.path.join(CACHE_DIR, "icon-names.json")
+BACKUP_VERSION = 1
+BACKUP_MANIFEST = "webapp-manager-backup.json"
+# Directories of browser caches, left out of backups unless asked for and removed by prune_caches()
+BROWSER_CACHE_NAMES = frozenset(("Cache", "Code Cache", "GPUCache", "GrShaderCache", "GraphiteDawnCache", "ShaderCache",
+                                "DawnCache", "DawnWebGPUCache", "DawnGraphiteCache", "CacheStorage", "ScriptCache",
+                                "component_crx_cache", "cache2", "startupCache", "shader-cache", "jumpListCache"))
+ICON_EXTENSIONS = (".png", ".svg", ".svgz", ".xpm")
+ICON_SUGGESTIONS = 6  # web-* icons suggested for a domain
+# Chromium components installed into <profile>/<name>/<version>/ by the component
+# updater, which adds a new version directory instead of changing an old one
+DEDUP_COMPONENTS = ("WidevineCdm", "CertificateRevocation", "hyphen-data", "ZxcvbnData", "SafetyTips", "FileTypePolicies",
+                    "MEIPreload", "OriginTrials", "TrustTokenKeyCommitments", "PKIMetadata", "SSLErrorAssistant",
+                    "FirstPartySetsPreloaded", "OnDeviceHeadSuggestModel", "AutofillStates", "pnacl",
+                    "Subresource Filter/Unindexed Rules")
+# Profile files browsers never write into, only replace, relative to the
+# profile: versioned components, unpacked extension versions
+# (Default/Extensions/<id>/1.2.3_0/), Firefox media plugins
+# (gmp-widevinecdm/4.10.2710.0/), spell-check dictionaries and extension
+# packages. Numbered directories elsewhere (File System/000/...) are
+# written in place and are not listed.
+DEDUP_IMMUTABLE = re.compile(r"^(%s)/\d+(\.\d+)*/|^[^/]+/Extensions/[a-p]{32}/\d+(\.\d+)*(_\d+)?/|^gmp-[^/]+/\d+(\.\d+)*/"
+                             r"|^Dictionaries/[^/]+\.bdic$|\.xpi$" % "|".join(map(re.escape, DEDUP_COMPONENTS)))
 BROWSER_TYPE_FIREFOX, BROWSER_TYPE_FIREFOX_FLATPAK, BROWSER_TYPE_FIREFOX_SNAP, BROWSER_TYPE_LIBREWOLF_FLATPAK, BROWSER_TYPE_WATERFOX_FLATPAK, BROWSER_TYPE_FLOORP_FLATPAK, BROWSER_TYPE_CHROMIUM, BROWSER_TYPE_EPIPHANY, BROWSER_TYPE_FALKON, BROWSER_TYPE_ZEN_FLATPAK = range(10)
+# Resource presets of Chromium based webapps (X-WebApp-Preset): name, label, flags.
+# Process and cache budgets are lowered and background downloads the app
+# doesn't need are turned off, so more webapps fit in a given amount of RAM.
+CHROMIUM_PRESETS = (
+    ("standard", _("Standard"), ()),
+    ("low-memory", _("Low memory"), (
+        "--renderer-process-limit=2",
+        "--disk-cache-size=52428800",
+        "--media-cache-size=10485760",
+        "--disable-background-networking",
+        "--disable-component-update",
+    )),
+    ("minimal", _("Minimal memory"), (
+        "--renderer-process-limit=1",
+        "--enable-low-end-device-mode",
+        "--aggressive-cache-discard",
+        "--disk-cache-size=10485760",
+        "--media-cache-size=1048576",
+        "--disable-background-networking",
+        "--disable-component-update",
+    )),
+)
+CHROMIUM_PRESET_FLAGS = {name: flags for name, _label, flags in CHROMIUM_PRESETS}
+
+# Browsers whose profile can be run from memory (X-WebApp-Volatile)
+VOLATILE_BROWSER_TYPES = (BROWSER_TYPE_FIREFOX, BROWSER_TYPE_FIREFOX_FLATPAK, BROWSER_TYPE_FIREFOX_SNAP, BROWSER_TYPE_ZEN_FLATPAK,
+                          BROWSER_TYPE_LIBREWOLF_FLATPAK, BROWSER_TYPE_FLOORP_FLATPAK)
 
 class Browser:
 
@@ -92,10 +177,186 @@ class Browser:
         self.exec_path = exec_path
         self.test_path = test_path
 
+# Supported browsers: type, name, exec, test
+SUPPORTED_BROWSERS = (
+    (BROWSER_TYPE_FIREFOX, "Firefox", "firefox", "/usr/bin/firefox"),
+    (BROWSER_TYPE_FIREFOX, "Firefox Developer Edition", "firefox-developer-edition", "/usr/bin/firefox-developer-edition"),
+    (BROWSER_TYPE_FIREFOX, "Firefox Nightly", "firefox-nightly", "/usr/bin/firefox-nightly"),
+    (BROWSER_TYPE_FIREFOX, "Firefox Extended Support Release", "firefox-esr", "/usr/bin/firefox-esr"),
+    (BROWSER_TYPE_FIREFOX_FLATPAK, "Firefox (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.mozilla.firefox"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.mozilla.firefox")),
+    (BROWSER_TYPE_FIREFOX_FLATPAK, "Firefox (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "org.mozilla.firefox"), os.path.join(USER_FLATPAK_BIN_DIR, "org.mozilla.firefox")),
+    (BROWSER_TYPE_ZEN_FLATPAK, "Zen (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "app.zen_browser.zen"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "app.zen_browser.zen")),
+    (BROWSER_TYPE_ZEN_FLATPAK, "Zen (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "app.zen_browser.zen"), os.path.join(USER_FLATPAK_BIN_DIR, "app.zen_browser.zen")),
+    (BROWSER_TYPE_FIREFOX_SNAP, "Firefox (Snap)", "/snap/bin/firefox", "/snap/bin/firefox"),
+    (BROWSER_TYPE_CHROMIUM, "Brave", "brave", "/usr/bin/brave"),
+    (BROWSER_TYPE_CHROMIUM, "Brave Browser", "brave-browser", "/usr/bin/brave-browser"),
+    (BROWSER_TYPE_CHROMIUM, "Brave (Bin)", "brave-bin", "/usr/bin/brave-bin"),
+    (BROWSER_TYPE_CHROMIUM, "Chrome", "google-chrome-stable", "/usr/bin/google-chrome-stable"),
+    (BROWSER_TYPE_CHROMIUM, "Chrome (Beta)", "google-chrome-beta", "/usr/bin/google-chrome-beta"),
+    (BROWSER_TYPE_CHROMIUM, "Chrome (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.google.Chrome"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.google.Chrome")),
+    (BROWSER_TYPE_CHROMIUM, "Chrome (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "com.google.Chrome"), os.path.join(USER_FLATPAK_BIN_DIR, "com.google.Chrome")),
+    (BROWSER_TYPE_CHROMIUM, "Chromium", "chromium", "/usr/bin/chromium"),
+    (BROWSER_TYPE_CHROMIUM, "Chromium (chromium-browser)", "chromium-browser", "/usr/bin/chromium-browser"),
+    (BROWSER_TYPE_CHROMIUM, "Chromium (Snap)", "chromium", "/snap/bin/chromium"),
+    (BROWSER_TYPE_CHROMIUM, "Chromium (Bin)", "chromium-bin", "/usr/bin/chromium-bin-browser"),
+    (BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium", "ungoogled-chromium", "/usr/bin/ungoogled-chromium"),
+    (BROWSER_TYPE_EPIPHANY, "Epiphany", "epiphany", "/usr/bin/epiphany"),
+    (BROWSER_TYPE_FIREFOX, "LibreWolf", "librewolf", "/usr/bin/librewolf"),
+    (BROWSER_TYPE_LIBREWOLF_FLATPAK, "LibreWolf (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "io.gitlab.librewolf-community"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "io.gitlab.librewolf-community")),
+    (BROWSER_TYPE_LIBREWOLF_FLATPAK, "LibreWolf (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "io.gitlab.librewolf-community"), os.path.join(USER_FLATPAK_BIN_DIR, "io.gitlab.librewolf-community")),
+    (BROWSER_TYPE_FIREFOX, "Waterfox", "waterfox", "/usr/bin/waterfox"),
+    (BROWSER_TYPE_FIREFOX, "Waterfox Current", "waterfox-current", "/usr/bin/waterfox-current"),
+    (BROWSER_TYPE_FIREFOX, "Waterfox Classic", "waterfox-classic", "/usr/bin/waterfox-classic"),
+    (BROWSER_TYPE_FIREFOX, "Waterfox 3rd Generation", "waterfox-g3", "/usr/bin/waterfox-g3"),
+    (BROWSER_TYPE_FIREFOX, "Waterfox 4th Generation", "waterfox-g4", "/usr/bin/waterfox-g4"),
+    (BROWSER_TYPE_FIREFOX, "Floorp", "floorp", "/usr/bin/floorp"),
+    (BROWSER_TYPE_WATERFOX_FLATPAK, "Waterfox (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "net.waterfox.waterfox"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "net.waterfox.waterfox")),
+    (BROWSER_TYPE_WATERFOX_FLATPAK, "Waterfox (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "net.waterfox.waterfox"), os.path.join(USER_FLATPAK_BIN_DIR, "net.waterfox.waterfox")),
+    (BROWSER_TYPE_CHROMIUM, "Vivaldi", "vivaldi-stable", "/usr/bin/vivaldi-stable"),
+    (BROWSER_TYPE_CHROMIUM, "Vivaldi Snapshot", "vivaldi-snapshot", "/usr/bin/vivaldi-snapshot"),
+    (BROWSER_TYPE_CHROMIUM, "Vivaldi (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.vivaldi.Vivaldi"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.vivaldi.Vivaldi")),
+    (BROWSER_TYPE_CHROMIUM, "Vivaldi (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "com.vivaldi.Vivaldi"), os.path.join(USER_FLATPAK_BIN_DIR, "com.vivaldi.Vivaldi")),
+    (BROWSER_TYPE_CHROMIUM, "Microsoft Edge", "microsoft-edge-stable", "/usr/bin/microsoft-edge-stable"),
+    (BROWSER_TYPE_CHROMIUM, "Microsoft Edge Beta", "microsoft-edge-beta", "/usr/bin/microsoft-edge-beta"),
+    (BROWSER_TYPE_CHROMIUM, "Microsoft Edge Dev", "microsoft-edge-dev", "/usr/bin/microsoft-edge-dev"),
+    (BROWSER_TYPE_CHROMIUM, "FlashPeak Slimjet", "flashpeak-slimjet", "/usr/bin/flashpeak-slimjet"),
+    (BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "io.github.ungoogled_software.ungoogled_chromium"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "io.github.ungoogled_software.ungoogled_chromium")),
+    (BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "io.github.ungoogled_software.ungoogled_chromium"), os.path.join(USER_FLATPAK_BIN_DIR, "io.github.ungoogled_software.ungoogled_chromium")),
+    (BROWSER_TYPE_CHROMIUM, "Chromium (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.chromium.Chromium"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.chromium.Chromium")),
+    (BROWSER_TYPE_CHROMIUM, "Chromium (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "org.chromium.Chromium"), os.path.join(USER_FLATPAK_BIN_DIR, "org.chromium.Chromium")),
+    (BROWSER_TYPE_FALKON, "Falkon", "falkon", "/usr/bin/falkon"),
+    (BROWSER_TYPE_CHROMIUM, "Edge (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.microsoft.Edge"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.microsoft.Edge")),
+    (BROWSER_TYPE_CHROMIUM, "Edge (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "com.microsoft.Edge"), os.path.join(USER_FLATPAK_BIN_DIR, "com.microsoft.Edge")),
+    (BROWSER_TYPE_CHROMIUM, "Brave (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.brave.Browser"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "com.brave.Browser")),
+    (BROWSER_TYPE_CHROMIUM, "Brave (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "com.brave.Browser"), os.path.join(USER_FLATPAK_BIN_DIR, "com.brave.Browser")),
+    (BROWSER_TYPE_CHROMIUM, "Yandex", "yandex-browser", "/usr/bin/yandex-browser"),
+    (BROWSER_TYPE_FALKON, "Falkon (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.kde.falkon"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "org.kde.falkon")),
+    (BROWSER_TYPE_FALKON, "Falkon (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "org.kde.falkon"), os.path.join(USER_FLATPAK_BIN_DIR, "org.kde.falkon")),
+    (BROWSER_TYPE_CHROMIUM, "Naver Whale", "naver-whale-stable", "/usr/bin/naver-whale-stable"),
+    (BROWSER_TYPE_CHROMIUM, "Yandex (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "ru.yandex.Browser"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "ru.yandex.Browser")),
+    (BROWSER_TYPE_CHROMIUM, "Yandex (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "ru.yandex.Browser"), os.path.join(USER_FLATPAK_BIN_DIR, "ru.yandex.Browser")),
+    (BROWSER_TYPE_CHROMIUM, "Thorium", "thorium-browser", "/usr/bin/thorium-browser"),
+    (BROWSER_TYPE_FLOORP_FLATPAK, "Floorp (Flatpak)", os.path.join(SYSTEM_FLATPAK_BIN_DIR, "one.ablaze.floorp"), os.path.join(SYSTEM_FLATPAK_BIN_DIR, "one.ablaze.floorp")),
+    (BROWSER_TYPE_FLOORP_FLATPAK, "Floorp (Flatpak)", os.path.join(USER_FLATPAK_BIN_DIR, "one.ablaze.floorp"), os.path.join(USER_FLATPAK_BIN_DIR, "one.ablaze.floorp")),
+)
+SUPPORTED_BROWSER_LIST = [Browser(*row) for row in SUPPORTED_BROWSERS]
+
+# Finds which of the supported browsers are installed.
+# Each candidate directory (/usr/bin, /snap/bin, the flatpak exports...)
+# is listed once with os.scandir and its entries are looked up in a
+# directory -> filename -> browsers index. The result is cached, in memory
+# and in BROWSERS_CACHE_PATH, keyed by the mtimes of those directories, so
+# it is only computed again after something was installed or removed.
+class BrowserDetector:
+
+    VERSION = 1
+
+    def __init__(self, browsers=SUPPORTED_BROWSER_LIST, cache_path=BROWSERS_CACHE_PATH):
+        self.browsers = browsers
+        self.cache_path = cache_path
+        self.index = {}  # directory -> filename -> [Browser]
+        for browser in browsers:
+            (directory, filename) = os.path.split(browser.test_path)
+            self.index.setdefault(directory, {}).setdefault(filename, []).append(browser)
+        self.key = None
+        self.installed = None
+
+    def directories_key(self):
+        key = []
+        for directory in sorted(self.index):
+            try:
+                stat = os.stat(directory)
+                key.append([directory, stat.st_ino, stat.st_mtime_ns])
+            except OSError:
+                key.append([directory, None, None])
+        return key
+
+    def scan(self):
+        found = set()
+        for directory, filenames in self.index.items():
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        # is_file() follows the flatpak export symlinks
+                        if entry.name in filenames and entry.is_file():
+                            found.add(entry.path)
+            except OSError:
+                continue
+        return found
+
+    def detect(self):
+        key = self.directories_key()
+        if self.installed is not None and key == self.key:
+            return self.installed
+
+        found = None
+        try:
+            with open(self.cache_path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == self.VERSION and data.get("key") == key:
+                found = set(data["found"])
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load browser cache", self.cache_path)
+            traceback.print_exc()
+
+        if found is None:
+            found = self.scan()
+            try:
+                os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+                tmp_path = "%s.%d.tmp" % (self.cache_path, os.getpid())
+                with open(tmp_path, "w") as cache_file:
+                    json.dump({"version": self.VERSION, "key": key, "found": sorted(found)}, cache_file)
+                os.replace(tmp_path, self.cache_path)
+            except OSError:
+                print("Could not save browser cache", self.cache_path)
+                traceback.print_exc()
+
+        self.key = key
+        self.installed = [browser for browser in self.browsers if browser.test_path in found]
+        return self.installed
+
+# Parsed launcher attributes stored in the launcher index
+LAUNCHER_FIELDS = ("web_browser", "name", "desc", "icon", "is_valid", "exec", "category", "url",
+                   "custom_parameters", "isolate_profile", "navbar", "privatewindow", "volatile", "preset")
+
+# Desktop entry value converters
+def _parse_bool(value):
+    return value.lower() == "true"
+
+def _parse_desc(value):
+    return "" if value == _("Web App") else value
+
+def _parse_category(value):
+    return value.replace("GTK;", "").replace(";", "")
+
+# Desktop entry key -> (launcher attribute, converter).
+# StartupWMClass has no attribute, it only tells whether the launcher is a webapp.
+DESKTOP_ENTRY_FIELDS = {
+    "StartupWMClass": (None, None),
+    "Name": ("name", None),
+    "Comment": ("desc", _parse_desc),
+    "Icon": ("icon", None),
+    "Exec": ("exec", None),
+    "Categories": ("category", _parse_category),
+    "X-WebApp-Browser": ("web_browser", None),
+    "X-WebApp-URL": ("url", None),
+    "X-WebApp-CustomParameters": ("custom_parameters", None),
+    "X-WebApp-Isolated": ("isolate_profile", _parse_bool),
+    "X-WebApp-Navbar": ("navbar", _parse_bool),
+    "X-WebApp-PrivateWindow": ("privatewindow", _parse_bool),
+    "X-WebApp-Volatile": ("volatile", _parse_bool),
+    "X-WebApp-Preset": ("preset", None),
+}
+WEBAPP_WM_CLASSES = ("WebApp", "Chromium", "ICE-SSB")
+
 # This is a data structure representing
 # the app menu item (path, name, icon..etc.)
 class WebAppLauncher:
 
+    __slots__ = ("path", "codename") + LAUNCHER_FIELDS
+
     def __init__(self, path, codename):
         self.path = path
         self.codename = codename
@@ -111,65 +372,292 @@ class WebAppLauncher:
         self.isolate_profile = False
         self.navbar = False
         self.privatewindow = False
+        self.volatile = False
+        self.preset = "standard"
 
+        # Single pass over the [Desktop Entry] group: each line is split once
+        # on "=" and dispatched through DESKTOP_ENTRY_FIELDS. Other groups
+        # (i.e. desktop actions) are not read.
         is_webapp = False
+        in_entry = False
+        fields = DESKTOP_ENTRY_FIELDS
         with open(path) as desktop_file:
             for line in desktop_file:
                 line = line.strip()
-
-                # Identify if the app is a webapp
-                if "StartupWMClass=WebApp" in line or "StartupWMClass=Chromium" in line or "StartupWMClass=ICE-SSB" in line:
-                    is_webapp = True
+                if not line or line[0] == "#":
                     continue
 
-                if "Name=" in line:
-                    self.name = line.replace("Name=", "")
+                if line[0] == "[":
+                    if in_entry:
+                        break
+                    in_entry = line == "[Desktop Entry]"
                     continue
 
-                if "Comment=" in line:
-                    self.desc = line.replace("Comment=", "")
-                    if self.desc == _("Web App"):
-                        self.desc = ""
+                if not in_entry:
                     continue
 
-                if "Icon=" in line:
-                    self.icon = line.replace("Icon=", "")
+                key, separator, value = line.partition("=")
+                if not separator:
                     continue
-
-                if "Exec=" in line:
-                    self.exec = line.replace("Exec=", "")
+                field = fields.get(key.rstrip())
+                if field is None:
                     continue
 
-                if "Categories=" in line:
-                    self.category = line.replace("Categories=", "").replace("GTK;", "").replace(";", "")
-                    continue
+                attribute, converter = field
+                value = value.lstrip()
+                if attribute is None:
+                    # Identify if the app is a webapp
+                    is_webapp = value.startswith(WEBAPP_WM_CLASSES)
+                elif converter is None:
+                    setattr(self, attribute, value)
+                else:
+                    setattr(self, attribute, converter(value))
 
-                if "X-WebApp-Browser=" in line:
-                    self.web_browser = line.replace("X-WebApp-Browser=", "")
-                    continue
+        if is_webapp and self.name is not None and self.icon is not None:
+            self.is_valid = True
 
-                if "X-WebApp-URL=" in line:
-                    self.url = line.replace("X-WebApp-URL=", "")
-                    continue
+    @classmethod
+    def from_record(cls, path, codename, record):
+        # Rebuild a launcher from a LauncherIndex record without reading the file
+        launcher = cls.__new__(cls)
+        launcher.path = path
+        launcher.codename = codename
+        for field in LAUNCHER_FIELDS:
+            setattr(launcher, field, record[field])
+        return launcher
+
+    def to_record(self):
+        return {field: getattr(self, field) for field in LAUNCHER_FIELDS}
+
+# Persistent index of the webapp launchers found in APPS_DIR.
+# Each entry is keyed by filename plus (inode, size, mtime_ns) of the
+# .desktop file, so only launchers which were added or modified since the
+# last scan are parsed again. Removed launchers are dropped from the index.
+class LauncherIndex:
+
+    VERSION = 4
+
+    def __init__(self, directory=APPS_DIR, cache_path=LAUNCHER_INDEX_PATH):
+        self.directory = directory
+        self.cache_path = cache_path
+        self.entries = None  # filename -> (stat key, record)
+        self.launchers = {}  # filename -> (stat key, WebAppLauncher)
+        self.dirty = False
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.cache_path) as cache_file:
+                data = json.load(cache_file)
+            # The "Web App" default description is translated when parsing,
+            # so records parsed under another locale cannot be reused.
+            if data.get("version") == self.VERSION and data.get("default_desc") == _("Web App"):
+                for filename, (key, record) in data["entries"].items():
+                    self.entries[filename] = (tuple(key), record)
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load launcher index", self.cache_path)
+            traceback.print_exc()
+            self.entries = {}
+
+    def save(self):
+        data = {"version": self.VERSION,
+                "default_desc": _("Web App"),
+                "entries": {filename: [list(key), record] for filename, (key, record) in self.entries.items()}}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.cache_path, os.getpid())
+            with open(tmp_path, "w") as cache_file:
+                json.dump(data, cache_file, separators=(",", ":"))
+            os.replace(tmp_path, self.cache_path)
+            self.dirty = False
+        except OSError:
+            print("Could not save launcher index", self.cache_path)
+            traceback.print_exc()
 
-                if "X-WebApp-CustomParameters" in line:
-                    self.custom_parameters = line.replace("X-WebApp-CustomParameters=", "")
+    @staticmethod
+    def is_launcher_filename(filename):
+        return filename.lower().startswith("webapp-") and filename.endswith(".desktop")
+
+    def _forget(self, filename):
+        if self.entries.pop(filename, None) is not None:
+            self.dirty = True
+        self.launchers.pop(filename, None)
+
+    def _check(self, filename, path, stat):
+        # Returns the launcher of an existing file, parsing it only if it changed
+        codename = filename.replace("webapp-", "").replace("WebApp-", "").replace(".desktop", "")
+        key = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+        # Unchanged launchers are returned as the very same objects,
+        # so callers can tell what changed with an identity check.
+        live = self.launchers.get(filename)
+        if live is not None and live[0] == key:
+            return live[1]
+
+        cached = self.entries.get(filename)
+        if cached is not None and cached[0] == key:
+            launcher = WebAppLauncher.from_record(path, codename, cached[1])
+        else:
+            try:
+                launcher = WebAppLauncher(path, codename)
+            except Exception:
+                print("Could not create webapp for path", path)
+                traceback.print_exc()
+                self._forget(filename)
+                return None
+            self.entries[filename] = (key, launcher.to_record())
+            self.dirty = True
+        self.launchers[filename] = (key, launcher)
+        return launcher
+
+    def scan(self):
+        if self.entries is None:
+            self.load()
+
+        launchers = []
+        seen = set()
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                filename = entry.name
+                if not self.is_launcher_filename(filename):
                     continue
-
-                if "X-WebApp-Isolated" in line:
-                    self.isolate_profile = line.replace("X-WebApp-Isolated=", "").lower() == "true"
+                try:
+                    # Epiphany launchers are symlinks, so follow them to key on the target
+                    if entry.is_dir():
+                        continue
+                    stat = entry.stat()
+                except OSError:
                     continue
+                seen.add(filename)
+                launcher = self._check(filename, entry.path, stat)
+                if launcher is not None and launcher.is_valid:
+                    launchers.append(launcher)
+
+        for filename in (self.entries.keys() | self.launchers.keys()) - seen:
+            self._forget(filename)
+
+        if self.dirty:
+            self.save()
+        return launchers
+
+    def update(self, filenames):
+        # Check only the given launcher files, without listing the directory.
+        # Returns filename -> valid launcher, or None when the file is gone or invalid.
+        if self.entries is None:
+            self.load()
+
+        launchers = {}
+        for filename in filenames:
+            path = os.path.join(self.directory, filename)
+            launcher = None
+            try:
+                stat = os.stat(path)
+            except OSError:
+                self._forget(filename)
+            else:
+                if not os.path.isdir(path):
+                    launcher = self._check(filename, path, stat)
+            launchers[filename] = launcher if launcher is not None and launcher.is_valid else None
+
+        if self.dirty:
+            self.save()
+        return launchers
+
+# Writes launchers atomically: each entry is rendered in memory, written to
+# a temporary file next to the launcher, fsynced and renamed over it, so a
+# crash never leaves a truncated launcher behind.
+# Outside of a batch each write is renamed on its own. Inside a batch
+# ("with writer:") the renames are deferred to the end of the batch, where
+# each directory is fsynced once and the desktop menus are refreshed once.
+# Temporary files left by a process which crashed in between are removed
+# by the next commit in their directory.
+class LauncherWriter:
 
-                if "X-WebApp-Navbar" in line:
-                    self.navbar = line.replace("X-WebApp-Navbar=", "").lower() == "true"
-                    continue
+    def __init__(self):
+        self.depth = 0
+        self.pending = {}  # launcher path -> temporary path
+
+    def __enter__(self):
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.depth -= 1
+        if self.depth == 0:
+            self.commit()
+        return False
+
+    def current_path(self, path):
+        # Where the content of a launcher can be read, before the batch is committed
+        return self.pending.get(path, path)
+
+    def write(self, path, content):
+        # Symlinked launchers (Epiphany) are written at their target
+        path = os.path.realpath(path)
+        tmp_path = self.pending.get(path) or "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "w") as desktop_file:
+            desktop_file.write(content)
+            desktop_file.flush()
+            os.fsync(desktop_file.fileno())
+        self.pending[path] = tmp_path
+        if self.depth == 0:
+            self.commit()
+
+    def commit(self):
+        if not self.pending:
+            return
+        pending = self.pending
+        self.pending = {}
+        directories = set()
+        for path, tmp_path in pending.items():
+            os.replace(tmp_path, path)
+            directories.add(os.path.dirname(path))
+        for directory in directories:
+            _remove_stale_launchers(directory)
+            fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        refresh_desktop_menus()
 
-                if "X-WebApp-PrivateWindow" in line:
-                    self.privatewindow = line.replace("X-WebApp-PrivateWindow=", "").lower() == "true"
-                    continue
+# Temporary launchers of LauncherWriter, named after the PID which wrote them
+LAUNCHER_TMP = re.compile(r"\.desktop\.(\d+)\.tmp$")
 
-        if is_webapp and self.name is not None and self.icon is not None:
-            self.is_valid = True
+# Removes the temporary launchers in a directory whose process is gone
+def _remove_stale_launchers(directory):
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return
+    for name in names:
+        match = LAUNCHER_TMP.search(name)
+        if match is None or int(match[1]) == os.getpid():
+            continue
+        try:
+            os.kill(int(match[1]), 0)
+            continue
+        except ProcessLookupError:
+            pass
+        except OSError:
+            # Alive, as another user
+            continue
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass
+
+# Asks the desktop to pick up added, changed or removed launchers
+def refresh_desktop_menus():
+    if shutil.which("update-desktop-database"):
+        import subprocess
+        try:
+            subprocess.Popen(["update-desktop-database", "-q", APPS_DIR],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+        except OSError:
+            pass
 
 # This is the backend.
 # It contains utility functions to load,
@@ -180,108 +668,197 @@ class WebAppManager:
         for directory in [ICE_DIR, APPS_DIR, PROFILES_DIR, FIREFOX_PROFILES_DIR, FIREFOX_FLATPAK_PROFILES_DIR, ICONS_DIR, EPIPHANY_PROFILES_DIR, FALKON_PROFILES_DIR]:
             if not os.path.exists(directory):
                 os.makedirs(directory)
+        self.launcher_index = LauncherIndex()
+        self.browser_detector = BrowserDetector()
+        self.launcher_writer = LauncherWriter()
+
+    def batch(self):
+        # Groups launcher writes, i.e. "with manager.batch(): ...", see LauncherWriter
+        return self.launcher_writer
 
     def get_webapps(self):
-        webapps = []
-        for filename in os.listdir(APPS_DIR):
-            if filename.lower().startswith("webapp-") and filename.endswith(".desktop"):
-                path = os.path.join(APPS_DIR, filename)
-                codename = filename.replace("webapp-", "").replace("WebApp-", "").replace(".desktop", "")
-                if not os.path.isdir(path):
-                    try:
-                        webapp = WebAppLauncher(path, codename)
-                        if webapp.is_valid:
-                            webapps.append(webapp)
-                    except Exception:
-                        print("Could not create webapp for path", path)
-                        traceback.print_exc()
+        return self.launcher_index.scan()
 
-        return webapps
+    def get_launcher_paths(self):
+        # Paths of every launcher file seen by the last scan, valid or not
+        return [os.path.join(self.launcher_index.directory, filename) for filename in self.launcher_index.launchers]
+
+    def update_webapps(self, paths):
+        # Re-read only the given launchers, returns path -> webapp (None if removed)
+        launchers = self.launcher_index.update(os.path.basename(path) for path in paths)
+        return {os.path.join(self.launcher_index.directory, filename): launcher for filename, launcher in launchers.items()}
 
     @staticmethod
     def get_supported_browsers():
-        # type, name, exec, test
-        return [Browser(BROWSER_TYPE_FIREFOX, "Firefox", "firefox", "/usr/bin/firefox"),
-                Browser(BROWSER_TYPE_FIREFOX, "Firefox Developer Edition", "firefox-developer-edition", "/usr/bin/firefox-developer-edition"),
-                Browser(BROWSER_TYPE_FIREFOX, "Firefox Nightly", "firefox-nightly", "/usr/bin/firefox-nightly"),
-                Browser(BROWSER_TYPE_FIREFOX, "Firefox Extended Support Release", "firefox-esr", "/usr/bin/firefox-esr"),
-                Browser(BROWSER_TYPE_FIREFOX_FLATPAK, "Firefox (Flatpak)", "/var/lib/flatpak/exports/bin/org.mozilla.firefox", "/var/lib/flatpak/exports/bin/org.mozilla.firefox"),
-                Browser(BROWSER_TYPE_FIREFOX_FLATPAK, "Firefox (Flatpak)", ".local/share/flatpak/exports/bin/org.mozilla.firefox", ".local/share/flatpak/exports/bin/org.mozilla.firefox"),
-                Browser(BROWSER_TYPE_ZEN_FLATPAK, "Zen (Flatpak)", "/var/lib/flatpak/exports/bin/app.zen_browser.zen", "/var/lib/flatpak/exports/bin/app.zen_browser.zen"),
-                Browser(BROWSER_TYPE_ZEN_FLATPAK, "Zen (Flatpak)", ".local/share/flatpak/exports/bin/app.zen_browser.zen", ".local/share/flatpak/exports/bin/app.zen_browser.zen"),
-                Browser(BROWSER_TYPE_FIREFOX_SNAP, "Firefox (Snap)", "/snap/bin/firefox", "/snap/bin/firefox"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Brave", "brave", "/usr/bin/brave"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Brave Browser", "brave-browser", "/usr/bin/brave-browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Brave (Bin)", "brave-bin", "/usr/bin/brave-bin"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chrome", "google-chrome-stable", "/usr/bin/google-chrome-stable"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chrome (Beta)", "google-chrome-beta", "/usr/bin/google-chrome-beta"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chrome (Flatpak)", "/var/lib/flatpak/exports/bin/com.google.Chrome", "/var/lib/flatpak/exports/bin/com.google.Chrome"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chrome (Flatpak)", ".local/share/flatpak/exports/bin/com.google.Chrome", ".local/share/flatpak/exports/bin/com.google.Chrome"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium", "chromium", "/usr/bin/chromium"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium (chromium-browser)", "chromium-browser", "/usr/bin/chromium-browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium (Snap)", "chromium", "/snap/bin/chromium"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium (Bin)", "chromium-bin", "/usr/bin/chromium-bin-browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium", "ungoogled-chromium", "/usr/bin/ungoogled-chromium"),
-                Browser(BROWSER_TYPE_EPIPHANY, "Epiphany", "epiphany", "/usr/bin/epiphany"),
-                Browser(BROWSER_TYPE_FIREFOX,  "LibreWolf", "librewolf", "/usr/bin/librewolf"),
-                Browser(BROWSER_TYPE_LIBREWOLF_FLATPAK,  "LibreWolf (Flatpak)", "/var/lib/flatpak/exports/bin/io.gitlab.librewolf-community", "/var/lib/flatpak/exports/bin/io.gitlab.librewolf-community"),
-                Browser(BROWSER_TYPE_LIBREWOLF_FLATPAK,  "LibreWolf (Flatpak)", ".local/share/flatpak/exports/bin/io.gitlab.librewolf-community", ".local/share/flatpak/exports/bin/io.gitlab.librewolf-community"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Waterfox", "waterfox", "/usr/bin/waterfox"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Waterfox Current", "waterfox-current", "/usr/bin/waterfox-current"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Waterfox Classic", "waterfox-classic", "/usr/bin/waterfox-classic"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Waterfox 3rd Generation", "waterfox-g3", "/usr/bin/waterfox-g3"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Waterfox 4th Generation", "waterfox-g4", "/usr/bin/waterfox-g4"),
-                Browser(BROWSER_TYPE_FIREFOX,  "Floorp", "floorp", "/usr/bin/floorp"),
-                Browser(BROWSER_TYPE_WATERFOX_FLATPAK, "Waterfox (Flatpak)", "/var/lib/flatpak/exports/bin/net.waterfox.waterfox", "/var/lib/flatpak/exports/bin/net.waterfox.waterfox"),
-                Browser(BROWSER_TYPE_WATERFOX_FLATPAK, "Waterfox (Flatpak)", ".local/share/flatpak/exports/bin/net.waterfox.waterfox", ".local/share/flatpak/exports/bin/net.waterfox.waterfox"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Vivaldi", "vivaldi-stable", "/usr/bin/vivaldi-stable"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Vivaldi Snapshot", "vivaldi-snapshot", "/usr/bin/vivaldi-snapshot"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Vivaldi (Flatpak)", "/var/lib/flatpak/exports/bin/com.vivaldi.Vivaldi", "/var/lib/flatpak/exports/bin/com.vivaldi.Vivaldi"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Vivaldi (Flatpak)", ".local/share/flatpak/exports/bin/com.vivaldi.Vivaldi", ".local/share/flatpak/exports/bin/com.vivaldi.Vivaldi"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Microsoft Edge", "microsoft-edge-stable", "/usr/bin/microsoft-edge-stable"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Microsoft Edge Beta", "microsoft-edge-beta", "/usr/bin/microsoft-edge-beta"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Microsoft Edge Dev", "microsoft-edge-dev", "/usr/bin/microsoft-edge-dev"),
-                Browser(BROWSER_TYPE_CHROMIUM, "FlashPeak Slimjet", "flashpeak-slimjet", "/usr/bin/flashpeak-slimjet"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium (Flatpak)", "/var/lib/flatpak/exports/bin/io.github.ungoogled_software.ungoogled_chromium", "/var/lib/flatpak/exports/bin/io.github.ungoogled_software.ungoogled_chromium"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Ungoogled Chromium (Flatpak)", ".local/share/flatpak/exports/bin/io.github.ungoogled_software.ungoogled_chromium", ".local/share/flatpak/exports/bin/io.github.ungoogled_software.ungoogled_chromium"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium (Flatpak)", "/var/lib/flatpak/exports/bin/org.chromium.Chromium", "/var/lib/flatpak/exports/bin/org.chromium.Chromium"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Chromium (Flatpak)", ".local/share/flatpak/exports/bin/org.chromium.Chromium", ".local/share/flatpak/exports/bin/org.chromium.Chromium"),
-                Browser(BROWSER_TYPE_FALKON, "Falkon", "falkon", "/usr/bin/falkon"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Edge (Flatpak)", "/var/lib/flatpak/exports/bin/com.microsoft.Edge", "/var/lib/flatpak/exports/bin/com.microsoft.Edge"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Edge (Flatpak)", ".local/share/flatpak/exports/bin/com.microsoft.Edge", ".local/share/flatpak/exports/bin/com.microsoft.Edge"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Brave (Flatpak)", "/var/lib/flatpak/exports/bin/com.brave.Browser", "/var/lib/flatpak/exports/bin/com.brave.Browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Brave (Flatpak)", ".local/share/flatpak/exports/bin/com.brave.Browser", ".local/share/flatpak/exports/bin/com.brave.Browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Yandex", "yandex-browser", "/usr/bin/yandex-browser"),
-                Browser(BROWSER_TYPE_FALKON, "Falkon (Flatpak)", "/var/lib/flatpak/exports/bin/org.kde.falkon", "/var/lib/flatpak/exports/bin/org.kde.falkon"),
-                Browser(BROWSER_TYPE_FALKON, "Falkon (Flatpak)", ".local/share/flatpak/exports/bin/org.kde.falkon", ".local/share/flatpak/exports/bin/org.kde.falkon"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Naver Whale", "naver-whale-stable", "/usr/bin/naver-whale-stable"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Yandex (Flatpak)", "/var/lib/flatpak/exports/bin/ru.yandex.Browser", "/var/lib/flatpak/exports/bin/ru.yandex.Browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Yandex (Flatpak)", ".local/share/flatpak/exports/bin/ru.yandex.Browser", ".local/share/flatpak/exports/bin/ru.yandex.Browser"),
-                Browser(BROWSER_TYPE_CHROMIUM, "Thorium", "thorium-browser", "/usr/bin/thorium-browser"),
-                Browser(BROWSER_TYPE_FIREFOX, "Floorp", "floorp", "/usr/bin/floorp"),
-                Browser(BROWSER_TYPE_FLOORP_FLATPAK, "Floorp (Flatpak)", "/var/lib/flatpak/exports/bin/one.ablaze.floorp", "/var/lib/flatpak/exports/bin/one.ablaze.floorp"),
-                Browser(BROWSER_TYPE_FLOORP_FLATPAK, "Floorp (Flatpak)", ".local/share/flatpak/exports/bin/one.ablaze.floorp", ".local/share/flatpak/exports/bin/one.ablaze.floorp")
-                ]
+        return list(SUPPORTED_BROWSER_LIST)
+
+    def get_installed_browsers(self):
+        return self.browser_detector.detect()
+
+    @staticmethod
+    def get_profile_paths(codename):
+        # Profile directories a webapp may own, and the symlinks pointing into them
+        paths = [os.path.join(directory, codename) for directory in
+                 (FIREFOX_PROFILES_DIR, FIREFOX_FLATPAK_PROFILES_DIR, ZEN_FLATPAK_PROFILES_DIR, FIREFOX_SNAP_PROFILES_DIR,
+                  LIBREWOLF_FLATPAK_PROFILES_DIR, FLOORP_FLATPAK_PROFILES_DIR, PROFILES_DIR, FALKON_PROFILES_DIR)]
+        paths.append(os.path.join(EPIPHANY_PROFILES_DIR, "org.gnome.Epiphany.WebApp-%s" % codename))
+        paths.append(os.path.join(os.path.expanduser("~/.local/share"), "org.gnome.Epiphany.WebApp-" + codename))
+        paths.append(os.path.join(os.path.expanduser("~/.config/falkon/profiles"), codename))
+        return paths
 
     def delete_webbapp(self, webapp):
-        shutil.rmtree(os.path.join(FIREFOX_PROFILES_DIR, webapp.codename), ignore_errors=True)
-        shutil.rmtree(os.path.join(FIREFOX_FLATPAK_PROFILES_DIR, webapp.codename), ignore_errors=True)
-        shutil.rmtree(os.path.join(ZEN_FLATPAK_PROFILES_DIR, webapp.codename), ignore_errors=True)
-        shutil.rmtree(os.path.join(FIREFOX_SNAP_PROFILES_DIR, webapp.codename), ignore_errors=True)
-        shutil.rmtree(os.path.join(PROFILES_DIR, webapp.codename), ignore_errors=True)
-        # first remove symlinks then others
-        if os.path.exists(webapp.path):
+        # The launcher and symlinks are removed, the profiles are moved to
+        # the trash, so this returns at once. TrashReaper frees the space.
+        if os.path.lexists(webapp.path):
             os.remove(webapp.path)
-        epiphany_orig_prof_dir=os.path.join(os.path.expanduser("~/.local/share"), "org.gnome.Epiphany.WebApp-" + webapp.codename)
-        if os.path.exists(epiphany_orig_prof_dir):
-            os.remove(epiphany_orig_prof_dir)
-        shutil.rmtree(os.path.join(EPIPHANY_PROFILES_DIR, "org.gnome.Epiphany.WebApp-%s" % webapp.codename), ignore_errors=True)
-        falkon_orig_prof_dir = os.path.join(os.path.expanduser("~/.config/falkon/profiles"), webapp.codename)
-        if os.path.exists(falkon_orig_prof_dir):
-            os.remove(falkon_orig_prof_dir)
-        shutil.rmtree(os.path.join(FALKON_PROFILES_DIR, webapp.codename), ignore_errors=True)
-
-    def create_webapp(self, name, desc, url, icon, category, browser, custom_parameters, isolate_profile=True, navbar=False, privatewindow=False):
+        for path in self.get_profile_paths(webapp.codename):
+            if os.path.islink(path):
+                os.remove(path)
+            elif os.path.isdir(path):
+                move_to_trash(path)
+
+    # Moves the browser cache directories of a webapp's profiles to the
+    # trash, returns how many were moved. Profiles of a running browser
+    # (which holds a lock in them) are left alone.
+    def prune_caches(self, webapp):
+        pruned = 0
+        for profile in dict.fromkeys(self.get_profile_paths(webapp.codename)):
+            if os.path.islink(profile) or not os.path.isdir(profile) or _profile_in_use(profile):
+                continue
+            caches = []
+            for dirpath, dirnames, _filenames in os.walk(profile):
+                for dirname in dirnames:
+                    if dirname in BROWSER_CACHE_NAMES:
+                        caches.append(os.path.join(dirpath, dirname))
+                # Don't look into caches, nor follow symlinks
+                dirnames[:] = [dirname for dirname in dirnames if dirname not in BROWSER_CACHE_NAMES
+                               and not os.path.islink(os.path.join(dirpath, dirname))]
+            for cache in caches:
+                move_to_trash(cache)
+                pruned += 1
+        return pruned
+
+    # Streams the launchers, icons and profiles of webapps into a tar archive
+    # written to fileobj, which doesn't need to be seekable (i.e. stdout).
+    # Paths are stored relative to the home directory and recorded in a
+    # manifest, so import_webapps() can restore them under another home.
+    def export_webapps(self, fileobj, webapps=None, include_caches=False, compression="gz"):
+        import tarfile
+        home = os.path.expanduser("~")
+        if webapps is None:
+            webapps = [webapp for webapp in self.get_webapps() if webapp.is_valid]
+
+        manifest = {"version": BACKUP_VERSION, "home": home, "webapps": []}
+        roots = []
+        for webapp in webapps:
+            paths = [webapp.path]
+            launchers = [webapp.path]
+            if os.path.islink(webapp.path):
+                # Epiphany launchers live in their profile
+                launchers = [os.path.realpath(webapp.path)]
+            if webapp.icon and os.path.isabs(webapp.icon) and os.path.isfile(webapp.icon):
+                paths.append(webapp.icon)
+            paths.extend(path for path in self.get_profile_paths(webapp.codename) if os.path.lexists(path))
+            paths = [path for path in paths if _is_under(path, home)]
+            manifest["webapps"].append({
+                "codename": webapp.codename,
+                "name": webapp.name,
+                "paths": [os.path.relpath(path, home) for path in paths],
+                "launchers": [os.path.relpath(path, home) for path in launchers if _is_under(path, home)],
+            })
+            roots.extend(paths)
+
+        def exclude_caches(tarinfo):
+            if not include_caches and os.path.basename(tarinfo.name) in BROWSER_CACHE_NAMES and tarinfo.isdir():
+                return None
+            return tarinfo
+
+        with tarfile.open(fileobj=fileobj, mode="w|" + compression) as tar:
+            data = json.dumps(manifest, indent=2).encode("utf-8")
+            tarinfo = tarfile.TarInfo(BACKUP_MANIFEST)
+            tarinfo.size = len(data)
+            tarinfo.mtime = int(time.time())
+            tar.addfile(tarinfo, io.BytesIO(data))
+            added = set()
+            for path in roots:
+                if path not in added:
+                    added.add(path)
+                    tar.add(path, os.path.relpath(path, home), filter=exclude_caches)
+        return manifest["webapps"]
+
+    # Restores an archive written by export_webapps(), reading it as a
+    # stream. The home directory of the exporting user is replaced by this
+    # one in launchers and symlink targets. Webapps whose launcher already
+    # exists are skipped unless overwrite is set.
+    def import_webapps(self, fileobj, overwrite=False):
+        import tarfile
+        home = os.path.expanduser("~")
+        try:
+            with tarfile.open(fileobj=fileobj, mode="r|*") as tar, self.batch():
+                member = tar.next()
+                if member is None or member.name != BACKUP_MANIFEST:
+                    raise ValueError(_("This is not a Web App backup"))
+                manifest = json.load(tar.extractfile(member))
+                if manifest.get("version") != BACKUP_VERSION:
+                    raise ValueError(_("Unsupported backup version"))
+                old_home = manifest["home"].rstrip("/") + "/"
+
+                # Archive roots of the restored webapps, the members of skipped webapps are not extracted
+                roots = set()
+                launchers = set()
+                restored = []
+                for webapp in manifest["webapps"]:
+                    codename = webapp["codename"]
+                    if not codename or "/" in codename or codename.startswith("."):
+                        raise ValueError(_("Unexpected path in backup: %s") % codename)
+                    paths = [os.path.normpath(path) for path in webapp["paths"]]
+                    # Only the locations this webapp could have been exported from are accepted
+                    expected = {os.path.relpath(path, home) for path in self.get_profile_paths(codename)}
+                    icons_dir = os.path.relpath(ICONS_DIR, home)
+                    apps_dir = os.path.relpath(APPS_DIR, home)
+                    # Launchers keep their exported name, Mint's are lowercase (webapp-<codename>.desktop)
+                    launcher_name = ("webapp-%s.desktop" % codename).lower()
+                    for path in paths:
+                        if os.path.dirname(path) == apps_dir and os.path.basename(path).lower() == launcher_name:
+                            continue
+                        if path not in expected and not (path.startswith(icons_dir + "/") and "/.." not in path):
+                            raise ValueError(_("Unexpected path in backup: %s") % path)
+
+                    launcher = os.path.join(home, paths[0])
+                    if os.path.lexists(launcher):
+                        if not overwrite:
+                            print("Skipping %s, it already exists" % codename)
+                            continue
+                        self.delete_webbapp(_BackupEntry(launcher, codename))
+                    restored.append(webapp)
+                    roots.update(paths)
+                    launchers.update(os.path.normpath(path) for path in webapp["launchers"])
+
+                for member in tar:
+                    name = os.path.normpath(member.name)
+                    if os.path.isabs(name) or name.startswith(".."):
+                        raise ValueError(_("Unsafe path in backup: %s") % member.name)
+                    if not any(name == root or name.startswith(root + "/") for root in roots):
+                        continue
+                    path = os.path.join(home, name)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    if member.issym() and member.linkname.startswith(old_home):
+                        member.linkname = os.path.join(home, member.linkname[len(old_home):])
+                    if name in launchers and member.isfile():
+                        if not _is_under(os.path.realpath(path), home):
+                            raise ValueError(_("Unsafe path in backup: %s") % member.name)
+                        content = tar.extractfile(member).read().decode("utf-8")
+                        self.launcher_writer.write(path, content.replace(old_home, home + "/"))
+                    elif hasattr(tarfile, "tar_filter"):
+                        tar.extract(member, home, filter="tar")
+                    else:
+                        tar.extract(member, home)
+        except tarfile.TarError as e:
+            raise ValueError(_("This is not a Web App backup") + " (%s)" % e) from e
+        return restored
+
+    def create_webapp(self, name, desc, url, icon, category, browser, custom_parameters, isolate_profile=True, navbar=False, privatewindow=False,
+                      volatile=False, preset="standard"):
         # Generate a 4 digit random code (to prevent name collisions, so we can define multiple launchers with the same name)
         random_code =  ''.join(choice(string.digits) for _ in range(4))
         codename = "".join(filter(str.isalpha, name)) + random_code
@@ -289,56 +866,66 @@ class WebAppManager:
 
         if not desc:
             desc = _("Web App")
+        volatile = volatile and browser.browser_type in VOLATILE_BROWSER_TYPES
+        if browser.browser_type != BROWSER_TYPE_CHROMIUM or not isolate_profile:
+            # Without its own profile the launch would go to, or start, the main browser
+            preset = "standard"
+
+        exec_string = self.get_exec_string(browser, codename, custom_parameters, icon, isolate_profile, navbar,
+                                           privatewindow, url, volatile, preset)
+        entry = [
+            "[Desktop Entry]",
+            "Version=1.0",
+            "Name=%s" % name,
+            "Comment=%s" % desc,
+            "Exec=%s" % exec_string,
+            "Terminal=false",
+            "X-MultipleArgs=false",
+            "Type=Application",
+            "Icon=%s" % icon,
+            "Categories=GTK;%s;" % category,
+            "MimeType=text/html;text/xml;application/xhtml_xml;",
+            "StartupWMClass=WebApp-%s" % codename,
+            "StartupNotify=true",
+            "X-WebApp-Browser=%s" % browser.name,
+            "X-WebApp-URL=%s" % url,
+            "X-WebApp-CustomParameters=%s" % custom_parameters,
+            "X-WebApp-Navbar=%s" % bool_to_string(navbar),
+            "X-WebApp-PrivateWindow=%s" % bool_to_string(privatewindow),
+            "X-WebApp-Isolated=%s" % bool_to_string(isolate_profile),
+            "X-WebApp-Volatile=%s" % bool_to_string(volatile),
+            "X-WebApp-Preset=%s" % preset,
+        ]
+        content = "\n".join(entry) + "\n"
+
+        if browser.browser_type == BROWSER_TYPE_EPIPHANY:
+            # Write the desktop file in the profile and symlink it
+            epiphany_profile_path = os.path.join(EPIPHANY_PROFILES_DIR, "org.gnome.Epiphany.WebApp-" + codename)
+            new_path = os.path.join(epiphany_profile_path, "org.gnome.Epiphany.WebApp-%s.desktop" % codename)
+            os.makedirs(epiphany_profile_path)
+            self.launcher_writer.write(new_path, content)
+            os.symlink(new_path, path)
+            # copy the icon to profile directory
+            new_icon=os.path.join(epiphany_profile_path, "app-icon.png")
+            shutil.copy(icon, new_icon)
+            # required for app mode. create an empty file .app
+            app_mode_file=os.path.join(epiphany_profile_path, ".app")
+            with open(app_mode_file, 'w') as fp:
+                pass
+        else:
+            self.launcher_writer.write(path, content)
 
-        with open(path, 'w') as desktop_file:
-            desktop_file.write("[Desktop Entry]\n")
-            desktop_file.write("Version=1.0\n")
-            desktop_file.write("Name=%s\n" % name)
-            desktop_file.write("Comment=%s\n" % desc)
-
-            exec_string = self.get_exec_string(browser, codename, custom_parameters, icon, isolate_profile, navbar,
-                                               privatewindow, url)
-
-            desktop_file.write("Exec=%s\n" % exec_string)
-            desktop_file.write("Terminal=false\n")
-            desktop_file.write("X-MultipleArgs=false\n")
-            desktop_file.write("Type=Application\n")
-            desktop_file.write("Icon=%s\n" % icon)
-            desktop_file.write("Categories=GTK;%s;\n" % category)
-            desktop_file.write("MimeType=text/html;text/xml;application/xhtml_xml;\n")
-            desktop_file.write("StartupWMClass=WebApp-%s\n" % codename)
-            desktop_file.write("StartupNotify=true\n")
-            desktop_file.write("X-WebApp-Browser=%s\n" % browser.name)
-            desktop_file.write("X-WebApp-URL=%s\n" % url)
-            desktop_file.write("X-WebApp-CustomParameters=%s\n" % custom_parameters)
-            desktop_file.write("X-WebApp-Navbar=%s\n" % bool_to_string(navbar))
-            desktop_file.write("X-WebApp-PrivateWindow=%s\n" % bool_to_string(privatewindow))
-            desktop_file.write("X-WebApp-Isolated=%s\n" % bool_to_string(isolate_profile))
-
-            if browser.browser_type == BROWSER_TYPE_EPIPHANY:
-                # Move the desktop file and create a symlink
-                epiphany_profile_path = os.path.join(EPIPHANY_PROFILES_DIR, "org.gnome.Epiphany.WebApp-" + codename)
-                new_path = os.path.join(epiphany_profile_path, "org.gnome.Epiphany.WebApp-%s.desktop" % codename)
-                os.makedirs(epiphany_profile_path)
-                os.replace(path, new_path)
-                os.symlink(new_path, path)
-                # copy the icon to profile directory
-                new_icon=os.path.join(epiphany_profile_path, "app-icon.png")
-                shutil.copy(icon, new_icon)
-                # required for app mode. create an empty file .app
-                app_mode_file=os.path.join(epiphany_profile_path, ".app")
-                with open(app_mode_file, 'w') as fp:
-                    pass
-
-            if browser.browser_type == BROWSER_TYPE_FALKON:
-                falkon_profile_path = os.path.join(FALKON_PROFILES_DIR, codename)
-                os.makedirs(falkon_profile_path)
-                # Create symlink of profile dir at ~/.config/falkon/profiles
-                falkon_orig_prof_dir = os.path.join(os.path.expanduser("~/.config/falkon/profiles"), codename)
-                os.symlink(falkon_profile_path, falkon_orig_prof_dir)
+        if browser.browser_type == BROWSER_TYPE_FALKON:
+            falkon_profile_path = os.path.join(FALKON_PROFILES_DIR, codename)
+            os.makedirs(falkon_profile_path)
+            # Create symlink of profile dir at ~/.config/falkon/profiles
+            falkon_orig_prof_dir = os.path.join(os.path.expanduser("~/.config/falkon/profiles"), codename)
+            os.symlink(falkon_profile_path, falkon_orig_prof_dir)
 
+        return codename
 
-    def get_exec_string(self, browser, codename, custom_parameters, icon, isolate_profile, navbar, privatewindow, url):
+    def get_exec_string(self, browser, codename, custom_parameters, icon, isolate_profile, navbar, privatewindow, url, volatile=False,
+                        preset="standard"):
         if browser.browser_type in [BROWSER_TYPE_FIREFOX, BROWSER_TYPE_FIREFOX_FLATPAK, BROWSER_TYPE_FIREFOX_SNAP, BROWSER_TYPE_ZEN_FLATPAK]:
             # Firefox based
             if browser.browser_type == BROWSER_TYPE_FIREFOX:
@@ -366,11 +953,10 @@ class WebAppManager:
                 exec_string += " {}".format(custom_parameters)
             exec_string += " \"" + url + "\""
             
-            # Create a Firefox profile
-            shutil.copytree('/usr/share/webapp-manager/firefox/profile', firefox_profile_path, dirs_exist_ok = True)
-            if navbar:
-                shutil.copy('/usr/share/webapp-manager/firefox/userChrome-with-navbar.css',
-                            os.path.join(firefox_profile_path, "chrome", "userChrome.css"))
+            # Create or update the Firefox profile
+            provision_firefox_profile(firefox_profile_path, navbar)
+            if volatile:
+                exec_string = "%s \"%s\" %s" % (VOLATILE_WRAPPER, firefox_profile_path, exec_string)
         elif browser.browser_type == BROWSER_TYPE_LIBREWOLF_FLATPAK:
             # LibreWolf flatpak
             firefox_profiles_dir = LIBREWOLF_FLATPAK_PROFILES_DIR
@@ -390,11 +976,10 @@ class WebAppManager:
                 exec_string += " {}".format(custom_parameters)
             exec_string += " \"" + url + "\""
             
-            # Create a Firefox profile
-            shutil.copytree('/usr/share/webapp-manager/firefox/profile', firefox_profile_path, dirs_exist_ok = True)
-            if navbar:
-                shutil.copy('/usr/share/webapp-manager/firefox/userChrome-with-navbar.css',
-                            os.path.join(firefox_profile_path, "chrome", "userChrome.css"))
+            # Create or update the Firefox profile
+            provision_firefox_profile(firefox_profile_path, navbar)
+            if volatile:
+                exec_string = "%s \"%s\" %s" % (VOLATILE_WRAPPER, firefox_profile_path, exec_string)
         elif browser.browser_type == BROWSER_TYPE_FLOORP_FLATPAK:
             # Floorp flatpak
             firefox_profiles_dir = FLOORP_FLATPAK_PROFILES_DIR
@@ -414,11 +999,10 @@ class WebAppManager:
                 exec_string += " {}".format(custom_parameters)
             exec_string += " \"" + url + "\""
             
-            # Create a Firefox profile
-            shutil.copytree('/usr/share/webapp-manager/firefox/profile', firefox_profile_path, dirs_exist_ok = True)
-            if navbar:
-                shutil.copy('/usr/share/webapp-manager/firefox/userChrome-with-navbar.css',
-                            os.path.join(firefox_profile_path, "chrome", "userChrome.css"))
+            # Create or update the Firefox profile
+            provision_firefox_profile(firefox_profile_path, navbar)
+            if volatile:
+                exec_string = "%s \"%s\" %s" % (VOLATILE_WRAPPER, firefox_profile_path, exec_string)
         elif browser.browser_type == BROWSER_TYPE_EPIPHANY:
             # Epiphany based
             epiphany_profile_path = os.path.join(EPIPHANY_PROFILES_DIR, "org.gnome.Epiphany.WebApp-" + codename)
@@ -442,7 +1026,7 @@ class WebAppManager:
                 exec_string += " --private-browsing"
             if custom_parameters:
                 exec_string += " {}".format(custom_parameters)
-            exec_string += " --no-remote " + url
+            exec_string += " --no-remote \"" + url + "\""
         else:
             # Chromium based
             if isolate_profile:
@@ -475,18 +1059,26 @@ class WebAppManager:
                 else:
                     exec_string += " --incognito"
 
+            # Before the custom parameters, which can override them
+            for flag in CHROMIUM_PRESET_FLAGS.get(preset, ()):
+                exec_string += " " + flag
+
             if custom_parameters:
                 exec_string += " {}".format(custom_parameters)
 
         return exec_string
 
-    def edit_webapp(self, path, name, desc, browser, url, icon, category, custom_parameters, codename, isolate_profile, navbar, privatewindow):
+    def edit_webapp(self, path, name, desc, browser, url, icon, category, custom_parameters, codename, isolate_profile, navbar, privatewindow,
+                    volatile=False, preset="standard"):
         if not desc:
             desc = _("Web App")
+        volatile = volatile and browser is not None and browser.browser_type in VOLATILE_BROWSER_TYPES
+        if browser is None or browser.browser_type != BROWSER_TYPE_CHROMIUM or not isolate_profile:
+            preset = "standard"
 
         config = configparser.RawConfigParser()
         config.optionxform = str
-        config.read(path)
+        config.read(self.launcher_writer.current_path(os.path.realpath(path)))
         config.set("Desktop Entry", "Name", name)
         config.set("Desktop Entry", "Icon", icon)
         config.set("Desktop Entry", "Comment", desc)
@@ -494,9 +1086,10 @@ class WebAppManager:
 
         try:
             # This will raise an exception on legacy apps which
-            # have no X-WebApp-URL and X-WebApp-Browser
+            # have no X-WebApp-URL and X-WebApp-Browser (browser is None)
 
-            exec_line = self.get_exec_string(browser, codename, custom_parameters, icon, isolate_profile, navbar, privatewindow, url)
+            exec_line = self.get_exec_string(browser, codename, custom_parameters, icon, isolate_profile, navbar, privatewindow, url,
+                                             volatile, preset)
 
             config.set("Desktop Entry", "Exec", exec_line)
             config.set("Desktop Entry", "X-WebApp-Browser", browser.name)
@@ -505,12 +1098,776 @@ class WebAppManager:
             config.set("Desktop Entry", "X-WebApp-Isolated", bool_to_string(isolate_profile))
             config.set("Desktop Entry", "X-WebApp-Navbar", bool_to_string(navbar))
             config.set("Desktop Entry", "X-WebApp-PrivateWindow", bool_to_string(privatewindow))
+            config.set("Desktop Entry", "X-WebApp-Volatile", bool_to_string(volatile))
+            config.set("Desktop Entry", "X-WebApp-Preset", preset)
 
         except:
             print("This WebApp was created with an old version of WebApp Manager. Its URL cannot be edited.")
 
-        with open(path, 'w') as configfile:
-            config.write(configfile, space_around_delimiters=False)
+        content = io.StringIO()
+        config.write(content, space_around_delimiters=False)
+        self.launcher_writer.write(path, content.getvalue())
+
+# Moves a directory to TRASH_DIR, a rename so it takes no time whatever
+# its size. A directory on another filesystem is renamed next to itself
+# and TRASH_DIR gets a JSON note with its new path, written before the
+# rename. Everything in TRASH_DIR is removed by TrashReaper.
+def move_to_trash(path):
+    os.makedirs(TRASH_DIR, exist_ok=True)
+    name = "%d.%d.%s" % (time.time_ns(), os.getpid(), os.path.basename(path))
+    try:
+        os.rename(path, os.path.join(TRASH_DIR, name))
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    deleted_path = os.path.join(os.path.dirname(path), ".%s.deleted" % name)
+    note_path = os.path.join(TRASH_DIR, name + ".json")
+    tmp_path = "%s.%d.tmp" % (note_path, os.getpid())
+    with open(tmp_path, "w") as note_file:
+        json.dump({"path": deleted_path}, note_file)
+    os.replace(tmp_path, note_path)
+    os.rename(path, deleted_path)
+
+# Removes what move_to_trash() moved, reporting progress through
+# progress(done, total, freed_bytes) where done and total count trashed
+# directories. A lock file makes sure a single process reaps at a time.
+# Items are only taken out of TRASH_DIR once fully removed, so a reaper
+# which was interrupted (cancel(), a crash) continues where it stopped
+# the next time it runs.
+class TrashReaper:
+
+    PROGRESS_FILES = 1000  # files removed between two progress reports
+
+    def __init__(self, trash_dir=TRASH_DIR):
+        self.trash_dir = trash_dir
+        self.cancelled = False
+        self.freed = 0
+
+    def pending(self):
+        try:
+            return sorted(name for name in os.listdir(self.trash_dir)
+                          if not name.startswith(".") and not name.endswith(".tmp"))
+        except FileNotFoundError:
+            return []
+
+    def cancel(self):
+        self.cancelled = True
+
+    def reap(self, progress=None):
+        # Returns False when another process is reaping, or when cancelled
+        if not self.pending():
+            return True
+        with open(os.path.join(self.trash_dir, ".lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            items = self.pending()
+            self.freed = 0
+            for index, name in enumerate(items):
+                path = os.path.join(self.trash_dir, name)
+                report = (lambda: progress(index, len(items), self.freed)) if progress else None
+                if name.endswith(".json"):
+                    try:
+                        with open(path) as note_file:
+                            target = json.load(note_file)["path"]
+                    except (OSError, ValueError, KeyError):
+                        target = None
+                    if target and os.path.basename(target).endswith(".deleted") and not self._remove_tree(target, report):
+                        return False
+                    os.remove(path)
+                elif not self._remove_tree(path, report):
+                    return False
+                if progress:
+                    progress(index + 1, len(items), self.freed)
+        return True
+
+    def _remove_tree(self, path, report):
+        count = 0
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            for filename in filenames:
+                try:
+                    file_path = os.path.join(dirpath, filename)
+                    self.freed += os.lstat(file_path).st_size
+                    os.unlink(file_path)
+                except FileNotFoundError:
+                    pass
+                count += 1
+                if count % self.PROGRESS_FILES == 0:
+                    if self.cancelled:
+                        return False
+                    if report:
+                        report()
+            for dirname in dirnames:
+                dir_path = os.path.join(dirpath, dirname)
+                try:
+                    # os.walk lists symlinks to directories without following them
+                    if os.path.islink(dir_path):
+                        os.unlink(dir_path)
+                    else:
+                        os.rmdir(dir_path)
+                except FileNotFoundError:
+                    pass
+        # Whatever could not be removed above (i.e. permissions)
+        shutil.rmtree(path, ignore_errors=True)
+        return True
+
+# Chromium keeps a SingletonLock symlink in its profile while it runs,
+# Firefox a lock symlink (and .parentlock), VolatileProfile a lock on its marker
+def _profile_in_use(profile):
+    if os.path.islink(os.path.join(profile, "SingletonLock")) or os.path.islink(os.path.join(profile, "lock")):
+        return True
+    # Run from memory by VolatileProfile, the browser lock is in the copy
+    try:
+        with open(os.path.join(profile, VOLATILE_MARKER), "rb") as marker:
+            fcntl.flock(marker, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except FileNotFoundError:
+        return False
+    except OSError:
+        return True
+    return False
+
+# Disk usage of the webapp profiles, computed incrementally.
+# For each directory the cache in DISK_USAGE_CACHE_PATH keeps its mtime,
+# the space used by the files directly in it and its subdirectories. A
+# directory whose mtime didn't change is not listed again, only its
+# subdirectories are checked, so a rescan costs one stat per directory
+# instead of one per file. Files rewritten in place without a change to
+# their directory are only counted again when it changes. A file with
+# several hardlinks counts as its share in each of them.
+class DiskUsageScanner:
+
+    VERSION = 2
+
+    def __init__(self, cache_path=DISK_USAGE_CACHE_PATH):
+        self.cache_path = cache_path
+        self.entries = None  # directory -> [mtime_ns, bytes of its files, subdirectory names]
+        self.visited = set()
+        self.cancelled = False
+        self.refresh = False
+
+    # Called from another thread, the scan stops without saving
+    def cancel(self):
+        self.cancelled = True
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.cache_path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == self.VERSION:
+                self.entries = data["entries"]
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load disk usage cache", self.cache_path)
+            traceback.print_exc()
+
+    def save(self):
+        # Directories not seen by this scan are gone, or belong to webapps not scanned
+        entries = {path: entry for path, entry in self.entries.items() if path in self.visited}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.cache_path, os.getpid())
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"version": self.VERSION, "entries": entries}, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            print("Could not save disk usage cache", self.cache_path)
+            traceback.print_exc()
+
+    def directory_usage(self, path):
+        if self.cancelled:
+            return 0
+        self.visited.add(path)
+        try:
+            mtime = os.lstat(path).st_mtime_ns
+        except OSError:
+            self.entries.pop(path, None)
+            return 0
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != mtime or self.refresh:
+            size = 0
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for dir_entry in it:
+                        try:
+                            if dir_entry.is_dir(follow_symlinks=False):
+                                subdirs.append(dir_entry.name)
+                            else:
+                                # Files hardlinked between profiles count once overall
+                                stat = dir_entry.stat(follow_symlinks=False)
+                                size += stat.st_blocks * 512 // max(stat.st_nlink, 1)
+                        except OSError:
+                            continue
+            except OSError:
+                pass
+            entry = self.entries[path] = [mtime, size, subdirs]
+        return entry[1] + sum(self.directory_usage(os.path.join(path, subdir)) for subdir in entry[2])
+
+    # Returns codename -> bytes, calling measured(codename, bytes) as each webapp is done.
+    # With refresh, every directory is listed again: hardlinks added or removed
+    # elsewhere change the share of a file without changing its directory.
+    def scan(self, codenames, measured=None, refresh=False):
+        if self.entries is None:
+            self.load()
+        self.visited = set()
+        self.refresh = refresh
+        usage = {}
+        for codename in codenames:
+            # Some of the profile directories may be the same one
+            profiles = dict.fromkeys(os.path.realpath(path) for path in WebAppManager.get_profile_paths(codename)
+                                     if not os.path.islink(path) and os.path.isdir(path))
+            usage[codename] = sum(self.directory_usage(path) for path in profiles)
+            if self.cancelled:
+                return usage
+            if measured is not None:
+                measured(codename, usage[codename])
+        self.save()
+        return usage
+
+# Stand-in for a WebAppLauncher when only its path and codename are known
+_BackupEntry = collections.namedtuple("_BackupEntry", ("path", "codename"))
+
+# Replaces identical files of webapp profiles by reflinks or hardlinks.
+# Only files of DEDUP_MIN_SIZE or more outside the browser caches are
+# considered, and only when at least two of them have the same size are
+# they hashed. Hashes are cached in DEDUP_CACHE_PATH by path, inode, size
+# and mtime, so a second pass only hashes new files. Where the filesystem
+# supports reflinks (btrfs, XFS...) the copies share their blocks and stay
+# independent files, so any file can be shared. Elsewhere only the files
+# matching DEDUP_IMMUTABLE are hardlinked, since a browser writing into a
+# hardlinked file would change it in every profile. Profiles of a running
+# browser are skipped.
+class ProfileDeduplicator:
+
+    VERSION = 1
+
+    def __init__(self, cache_path=DEDUP_CACHE_PATH):
+        self.cache_path = cache_path
+        self.entries = {}  # path -> [inode, size, mtime_ns, sha256]
+        self.no_reflink = set()  # devices where FICLONE failed
+        self.cancelled = False
+        self.reclaimed = 0
+
+    # Called from another thread, the pass stops after the current file
+    def cancel(self):
+        self.cancelled = True
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.cache_path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == self.VERSION:
+                self.entries = data["entries"]
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load profile hash cache", self.cache_path)
+            traceback.print_exc()
+
+    def save(self, paths):
+        entries = {path: entry for path, entry in self.entries.items() if path in paths}
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.cache_path, os.getpid())
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"version": self.VERSION, "entries": entries}, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            print("Could not save profile hash cache", self.cache_path)
+            traceback.print_exc()
+
+    def candidates(self, codenames):
+        # path -> (stat, immutable)
+        found = {}
+        for codename in codenames:
+            for profile in dict.fromkeys(WebAppManager.get_profile_paths(codename)):
+                if os.path.islink(profile) or not os.path.isdir(profile) or _profile_in_use(profile):
+                    continue
+                for dirpath, dirnames, filenames in os.walk(profile):
+                    dirnames[:] = [dirname for dirname in dirnames if dirname not in BROWSER_CACHE_NAMES
+                                   and not os.path.islink(os.path.join(dirpath, dirname))]
+                    for filename in filenames:
+                        path = os.path.join(dirpath, filename)
+                        try:
+                            stat = os.lstat(path)
+                        except OSError:
+                            continue
+                        if stat.st_size >= DEDUP_MIN_SIZE and (stat.st_mode & 0o170000) == 0o100000:
+                            immutable = DEDUP_IMMUTABLE.search(os.path.relpath(path, profile)) is not None
+                            found[path] = (stat, immutable)
+        return found
+
+    def digest(self, path, stat):
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == [stat.st_ino, stat.st_size, stat.st_mtime_ns]:
+            return entry[3]
+        with open(path, "rb") as file:
+            digest = hashlib.file_digest(file, "sha256").hexdigest()
+        self.entries[path] = [stat.st_ino, stat.st_size, stat.st_mtime_ns, digest]
+        return digest
+
+    def share(self, keeper, path, stat, immutable):
+        # Makes `path` a reflink, or a hardlink, of `keeper`. Returns whether it did.
+        tmp_path = path + ".dedup.tmp"
+        try:
+            if stat.st_dev not in self.no_reflink:
+                try:
+                    with open(keeper, "rb") as source_file, open(tmp_path, "wb") as tmp_file:
+                        fcntl.ioctl(tmp_file.fileno(), FICLONE, source_file.fileno())
+                    shutil.copystat(path, tmp_path)
+                    os.replace(tmp_path, path)
+                    return True
+                except OSError:
+                    self.no_reflink.add(stat.st_dev)
+                    if os.path.lexists(tmp_path):
+                        os.remove(tmp_path)
+            if not immutable:
+                return False
+            os.link(keeper, tmp_path)
+            os.replace(tmp_path, path)
+            return True
+        except OSError as e:
+            print("Could not deduplicate", path, e)
+            if os.path.lexists(tmp_path):
+                os.remove(tmp_path)
+            return False
+
+    # Deduplicates the profiles of the given webapps, calling progress(done, total)
+    # as files are hashed. Returns the number of bytes reclaimed.
+    def run(self, codenames, progress=None):
+        self.load()
+        self.reclaimed = 0
+        candidates = self.candidates(codenames)
+
+        by_size = collections.defaultdict(list)
+        for path, (stat, _immutable) in candidates.items():
+            by_size[(stat.st_dev, stat.st_size)].append(path)
+        groups = [paths for paths in by_size.values() if len(paths) > 1]
+        total = sum(len(paths) for paths in groups)
+        done = 0
+
+        for paths in groups:
+            by_digest = collections.defaultdict(list)
+            for path in paths:
+                if self.cancelled:
+                    self.save(candidates)
+                    return self.reclaimed
+                try:
+                    by_digest[self.digest(path, candidates[path][0])].append(path)
+                except OSError:
+                    pass
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+            for digest, same in by_digest.items():
+                # The most linked copy is kept, files already sharing its inode are left alone
+                same.sort(key=lambda path: -candidates[path][0].st_nlink)
+                keeper = same[0]
+                keeper_stat, keeper_immutable = candidates[keeper]
+                for path in same[1:]:
+                    stat, immutable = candidates[path]
+                    if stat.st_ino == keeper_stat.st_ino:
+                        continue
+                    if not self.share(keeper, path, stat, immutable and keeper_immutable):
+                        continue
+                    if stat.st_nlink == 1:
+                        self.reclaimed += stat.st_blocks * 512
+                    new_stat = os.lstat(path)
+                    self.entries[path] = [new_stat.st_ino, new_stat.st_size, new_stat.st_mtime_ns, digest]
+        self.save(candidates)
+        return self.reclaimed
+
+# Names left out when a profile is copied to memory or synced back:
+# the browser locks, the marker and the caches
+VOLATILE_SKIP = frozenset(("lock", ".parentlock", VOLATILE_MARKER)) | BROWSER_CACHE_NAMES
+
+# Directory in memory (tmpfs) for the volatile copy of a profile, None when
+# there is no $XDG_RUNTIME_DIR. Flatpak and Snap browsers only see a
+# directory of their own there, at the same path.
+def volatile_runtime_dir(profile_path):
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if not runtime_dir or not os.path.isdir(runtime_dir):
+        return None
+    relative = os.path.relpath(profile_path, os.path.expanduser("~"))
+    parts = relative.split(os.sep)
+    if parts[:2] == [".var", "app"] and len(parts) > 2:
+        runtime_dir = os.path.join(runtime_dir, "app", parts[2])
+    elif parts[0] == "snap" and len(parts) > 1:
+        runtime_dir = os.path.join(runtime_dir, "snap." + parts[1])
+    return os.path.join(runtime_dir, "webapp-manager", os.path.basename(profile_path.rstrip("/")))
+
+# Makes `destination` a copy of `source`: files with another size or mtime
+# are copied (to a temporary file renamed over the old one, so a crash
+# never leaves half a file), files gone from `source` are removed. Names
+# in `skip` are neither copied nor removed.
+def _mirror_tree(source, destination, skip=VOLATILE_SKIP):
+    os.makedirs(destination, exist_ok=True)
+    names = set()
+    with os.scandir(source) as entries:
+        for entry in entries:
+            if entry.name in skip or entry.name.endswith(".sync.tmp"):
+                continue
+            names.add(entry.name)
+            target = os.path.join(destination, entry.name)
+            try:
+                current = os.lstat(target)
+            except FileNotFoundError:
+                current = None
+            if current is not None and (current.st_mode & 0o170000) == 0o040000 and not entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(target)
+                current = None
+            if entry.is_symlink():
+                link = os.readlink(entry.path)
+                if current is None or not os.path.islink(target) or os.readlink(target) != link:
+                    tmp_path = target + ".sync.tmp"
+                    os.symlink(link, tmp_path)
+                    os.replace(tmp_path, target)
+            elif entry.is_dir():
+                if current is not None and (current.st_mode & 0o170000) != 0o040000:
+                    os.remove(target)
+                _mirror_tree(entry.path, target, skip)
+            else:
+                stat = entry.stat(follow_symlinks=False)
+                if current is None or current.st_size != stat.st_size or current.st_mtime_ns != stat.st_mtime_ns:
+                    tmp_path = target + ".sync.tmp"
+                    shutil.copy2(entry.path, tmp_path, follow_symlinks=False)
+                    os.replace(tmp_path, target)
+    for name in os.listdir(destination):
+        if name in names or name in skip:
+            continue
+        path = os.path.join(destination, name)
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+# A Firefox profile run from memory, for webapps with X-WebApp-Volatile.
+# acquire() locks the marker in the profile on disk and copies it to
+# volatile_runtime_dir(); sync() copies the changes back; release() syncs
+# a last time and frees the memory. The marker stays on disk while the
+# copy is used: after a crash, the next acquire() first saves the copy
+# left in memory, or after a reboot, starts again from the profile on
+# disk, as of its last sync.
+class VolatileProfile:
+
+    def __init__(self, profile_path):
+        self.profile_path = profile_path
+        self.runtime_path = volatile_runtime_dir(profile_path)
+        self.marker = None
+
+    # Raises BlockingIOError when another instance uses the profile
+    def acquire(self):
+        self.marker = open(os.path.join(self.profile_path, VOLATILE_MARKER), "a")
+        try:
+            fcntl.flock(self.marker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.marker.close()
+            self.marker = None
+            raise
+        if os.path.isdir(self.runtime_path):
+            # Left by a session which didn't end cleanly, its browser is gone
+            for name in ("lock", ".parentlock"):
+                if os.path.lexists(os.path.join(self.runtime_path, name)):
+                    os.remove(os.path.join(self.runtime_path, name))
+            _mirror_tree(self.runtime_path, self.profile_path)
+        else:
+            _mirror_tree(self.profile_path, self.runtime_path)
+
+    def sync(self):
+        # Not when the webapp was deleted meanwhile
+        if os.path.isdir(self.profile_path):
+            _mirror_tree(self.runtime_path, self.profile_path)
+
+    def release(self):
+        try:
+            self.sync()
+            shutil.rmtree(self.runtime_path, ignore_errors=True)
+            if os.path.isdir(self.profile_path):
+                os.remove(os.path.join(self.profile_path, VOLATILE_MARKER))
+        finally:
+            self.marker.close()
+            self.marker = None
+
+# Escapes of desktop entry string values
+DESKTOP_ENTRY_ESCAPES = {"s": " ", "n": "\n", "t": "\t", "r": "\r", "\\": "\\"}
+DESKTOP_ENTRY_ESCAPE = re.compile(r"\\(.?)", re.S)
+# Tokens of an Exec value: quoted text, field code, spaces, other characters, stray quote
+EXEC_TOKEN = re.compile(r'"((?:[^"\\]|\\.)*)"|%(.?)|([ \t\n]+)|([^ \t\n"%]+)|(")', re.S)
+EXEC_QUOTED_ESCAPE = re.compile(r'\\([\\"`$])')
+# Characters which have to be quoted in an Exec argument, or it is meant for a shell
+EXEC_RESERVED = frozenset("'\\><~|&;$*?#()`")
+
+# Splits the Exec value of a desktop entry into an argument vector, as the
+# desktop entry specification describes: string escapes are decoded first,
+# then arguments are split on spaces, double quoted arguments keep their
+# spaces and the field codes are expanded (%f, %u... to nothing, since
+# webapps are never given files). Raises ValueError for a command line
+# only a shell could run (unbalanced quotes, unquoted reserved characters).
+def split_exec(value, name="", icon="", path=""):
+    if "\\" in value:
+        value = DESKTOP_ENTRY_ESCAPE.sub(lambda match: DESKTOP_ENTRY_ESCAPES.get(match[1], match[0]), value)
+
+    argv = []
+    argument = None  # parts of the current argument, None between arguments
+    for match in EXEC_TOKEN.finditer(value):
+        kind = match.lastindex
+        if kind == 3:
+            # Spaces
+            if argument is not None:
+                argv.append("".join(argument))
+                argument = None
+            continue
+        if kind == 5:
+            raise ValueError("Unterminated quote in %r" % value)
+        if argument is None:
+            argument = []
+        if kind == 4:
+            text = match[4]
+            if not EXEC_RESERVED.isdisjoint(text):
+                raise ValueError("Unquoted shell characters in %r" % value)
+            argument.append(text)
+        elif kind == 1:
+            quoted = match[1]
+            argument.append(EXEC_QUOTED_ESCAPE.sub(r"\1", quoted) if "\\" in quoted else quoted)
+        else:
+            code = match[2]
+            if code == "%":
+                argument.append("%")
+            elif code == "c":
+                argument.append(name)
+            elif code == "k":
+                argument.append(path)
+            elif code == "i":
+                # Expands to two arguments, only when standing alone
+                if icon and not argument:
+                    argv.extend(("--icon", icon))
+            # %f, %F, %u, %U and the deprecated codes expand to nothing
+            elif not code or code not in "fFuUdDnNvm":
+                raise ValueError("Unknown field code %%%s in %r" % (code, value))
+            if code in "fFuUdDnNvmi" and not argument:
+                # A field code alone is removed with its argument
+                argument = None
+    if argument is not None:
+        argv.append("".join(argument))
+    if not argv:
+        raise ValueError("Empty command line")
+    return argv
+
+# A webapp started by LaunchEngine
+Launch = collections.namedtuple("Launch", ("codename", "pid", "argv", "started", "latency"))
+# What LaunchEngine.activate() did
+ACTIVATE_LAUNCHED, ACTIVATE_FOCUSED, ACTIVATE_RUNNING = range(3)
+
+# Generated launchers pass WebApp-<codename> to the browser as its window
+# class (and Epiphany has it in its profile path)
+WEBAPP_CLASS_ARGUMENT = re.compile(rb"WebApp-([^\x00\s/\"'=]+)")
+
+# Scans the command lines in /proc for the processes of running webapps.
+# Returns codename -> PIDs, for the processes of this user only.
+def find_running_webapps():
+    running = {}
+    uid = os.getuid()
+    try:
+        entries = os.scandir("/proc")
+    except OSError:
+        return running
+    with entries:
+        for entry in entries:
+            if not entry.name.isdigit():
+                continue
+            try:
+                if entry.stat().st_uid != uid:
+                    continue
+                with open("/proc/%s/cmdline" % entry.name, "rb") as cmdline_file:
+                    cmdline = cmdline_file.read()
+            except OSError:
+                # Exited meanwhile
+                continue
+            if b"WebApp-" not in cmdline:
+                continue
+            for codename in set(match[1] for match in WEBAPP_CLASS_ARGUMENT.finditer(cmdline)):
+                running.setdefault(codename.decode("utf-8", "replace"), []).append(int(entry.name))
+    return running
+
+# Brings the window with the given class to the front, with the first
+# tool found which can do it. Returns whether a window was activated.
+def activate_window(wm_class):
+    import subprocess
+    pattern = "^%s$" % re.escape(wm_class)
+    commands = [["xdotool", "search", "--class", pattern, "windowactivate"], ["wmctrl", "-x", "-a", wm_class]]
+    if is_wayland():
+        commands.insert(0, ["kdotool", "search", "--class", pattern, "windowactivate"])
+    for command in commands:
+        if shutil.which(command[0]) is None:
+            continue
+        try:
+            if subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=2).returncode == 0:
+                return True
+        except (OSError, subprocess.TimeoutExpired):
+            continue
+    return False
+
+# Brings a running webapp to the front. When that isn't possible, Chromium
+# based browsers may be launched anyway since they hand the launch over to
+# the instance running with the same profile, the others would start a
+# second browser (or fail on the profile lock). Returns ACTIVATE_FOCUSED,
+# ACTIVATE_RUNNING, or ACTIVATE_LAUNCHED when the webapp should be launched.
+# It scans /proc and may wait for the window tools, keep it off GUI threads.
+def activate_running(webapp):
+    if webapp.codename not in find_running_webapps():
+        return ACTIVATE_LAUNCHED
+    if activate_window("WebApp-" + webapp.codename):
+        return ACTIVATE_FOCUSED
+    browser_types = {browser.name: browser.browser_type for browser in SUPPORTED_BROWSER_LIST}
+    if browser_types.get(webapp.web_browser) != BROWSER_TYPE_CHROMIUM:
+        return ACTIVATE_RUNNING
+    return ACTIVATE_LAUNCHED
+
+# Starts webapps without a shell in between: the Exec value is split by
+# split_exec() and spawned with posix_spawnp() in a new session, so the
+# browser outlives the manager. Each launch records its PID, start time
+# and latency (from the call to the spawned process). Children are reaped
+# by reap() without blocking; a pidfd, when the kernel has them, tells
+# when a child exited so callers don't have to poll.
+class LaunchEngine:
+
+    def __init__(self):
+        self.children = {}  # pid -> Launch
+        self.pidfds = {}  # pid -> pidfd
+
+    def launch(self, webapp, quiet=False):
+        start = time.perf_counter()
+        try:
+            argv = split_exec(webapp.exec, webapp.name or "", webapp.icon or "", webapp.path)
+        except ValueError:
+            # Written by hand for a shell, run it as before
+            argv = ["/bin/sh", "-c", webapp.exec]
+        file_actions = []
+        if quiet:
+            file_actions = [(os.POSIX_SPAWN_OPEN, fd, os.devnull, os.O_RDWR, 0) for fd in (0, 1, 2)]
+        pid = os.posix_spawnp(argv[0], argv, os.environ, file_actions=file_actions, setsid=True)
+        latency = time.perf_counter() - start
+        launch = self.children[pid] = Launch(webapp.codename, pid, argv, time.time(), latency)
+        if hasattr(os, "pidfd_open"):
+            try:
+                self.pidfds[pid] = os.pidfd_open(pid)
+            except OSError:
+                pass
+        return launch
+
+    def pidfd(self, pid):
+        return self.pidfds.get(pid, -1)
+
+    # Launches a webapp, unless it already runs (see activate_running()).
+    # Returns (ACTIVATE_*, Launch or None).
+    def activate(self, webapp, quiet=False):
+        result = activate_running(webapp)
+        if result != ACTIVATE_LAUNCHED:
+            return result, None
+        return ACTIVATE_LAUNCHED, self.launch(webapp, quiet)
+
+    # Returns (Launch, exit status) for each child which exited
+    def reap(self):
+        exited = []
+        for pid in list(self.children):
+            try:
+                waited, status = os.waitpid(pid, os.WNOHANG)
+            except ChildProcessError:
+                waited, status = pid, 0
+            if waited == 0:
+                continue
+            pidfd = self.pidfds.pop(pid, None)
+            if pidfd is not None:
+                os.close(pidfd)
+            exited.append((self.children.pop(pid), os.waitstatus_to_exitcode(status)))
+        return exited
+
+def _is_under(path, directory):
+    return path == directory or path.startswith(directory.rstrip("/") + "/")
+
+FICLONE = 0x40049409  # linux/fs.h, _IOW(0x94, 9, int)
+
+# Fill a Firefox profile from the template in FIREFOX_PROFILE_TEMPLATE.
+# The profile keeps a stamp recording which template file (path, size,
+# mtime) each of its files came from, so files which are already up to
+# date are skipped and re-provisioning an unchanged profile is a handful
+# of stat calls. Files are installed, by order of preference, as
+# hardlinks (read-only template files only), reflinks or plain copies.
+def provision_firefox_profile(profile_path, navbar):
+    sources = {}
+    for root, _dirs, filenames in os.walk(FIREFOX_PROFILE_TEMPLATE):
+        for filename in filenames:
+            source = os.path.join(root, filename)
+            sources[os.path.relpath(source, FIREFOX_PROFILE_TEMPLATE)] = source
+    if navbar:
+        sources[os.path.join("chrome", "userChrome.css")] = FIREFOX_NAVBAR_CSS
+
+    stamp_path = os.path.join(profile_path, FIREFOX_PROFILE_STAMP)
+    try:
+        with open(stamp_path) as stamp_file:
+            stamp = json.load(stamp_file)
+    except (OSError, ValueError):
+        stamp = {}
+
+    installed = {}
+    changed = False
+    for relative_path, source in sources.items():
+        stat = os.stat(source)
+        signature = [source, stat.st_size, stat.st_mtime_ns]
+        destination = os.path.join(profile_path, relative_path)
+        if stamp.get(relative_path) != signature or not os.path.lexists(destination):
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            _install_profile_file(source, destination, stat)
+            changed = True
+        installed[relative_path] = signature
+
+    if changed or installed != stamp:
+        tmp_path = stamp_path + ".tmp"
+        with open(tmp_path, "w") as stamp_file:
+            json.dump(installed, stamp_file)
+        os.replace(tmp_path, stamp_path)
+
+def _install_profile_file(source, destination, stat):
+    # The file is prepared next to the destination and renamed over it,
+    # so a profile file hardlinked to the template is never written into.
+    tmp_path = destination + ".tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+
+    # Only templates nobody may write to: a root-owned 0644 file would make
+    # a profile file the user can't edit in place
+    if not stat.st_mode & 0o222:
+        try:
+            os.link(source, tmp_path)
+            os.replace(tmp_path, destination)
+            return
+        except OSError:
+            # Other filesystem, or fs.protected_hardlinks
+            pass
+
+    with open(source, "rb") as source_file, open(tmp_path, "wb") as tmp_file:
+        try:
+            fcntl.ioctl(tmp_file.fileno(), FICLONE, source_file.fileno())
+        except OSError:
+            try:
+                remaining = stat.st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(source_file.fileno(), tmp_file.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (OSError, AttributeError):
+                source_file.seek(0)
+                tmp_file.seek(0)
+                tmp_file.truncate()
+                shutil.copyfileobj(source_file, tmp_file)
+    shutil.copymode(source, tmp_path)
+    os.replace(tmp_path, destination)
 
 def bool_to_string(boolean):
     if boolean:
@@ -524,17 +1881,579 @@ def normalize_url(url):
         return urllib.parse.urlunparse((scheme, path, "", "", "", ""))
     return urllib.parse.urlunparse((scheme, netloc, path, "", "", ""))
 
-def download_image(root_url: str, link: str) -> Optional[PIL.Image.Image]:
+DomainParts = collections.namedtuple("DomainParts", ("subdomain", "domain", "suffix"))
+
+# Public suffix matching, without network access.
+# The ICANN section of the public suffix list is compiled into a trie of
+# reversed labels: each node is a dict of label -> node, where a node is 0
+# for a rule without longer rules below it, and a "." key marks a dict
+# node which is also a rule. Exception rules are stored as "!label": 0.
+# The trie is shipped precompiled in PUBLIC_SUFFIX_PATH, and compiled
+# from the system list when that file is missing.
+class PublicSuffixList:
+
+    VERSION = 1
+
+    def __init__(self, trie=None):
+        self.trie = trie if trie is not None else {}
+
+    @staticmethod
+    def compile(text):
+        trie = {}
+        in_icann = False
+        for line in text.splitlines():
+            line = line.strip()
+            if line.startswith("//"):
+                if "===BEGIN ICANN DOMAINS===" in line:
+                    in_icann = True
+                elif "===END ICANN DOMAINS===" in line:
+                    break
+                continue
+            if not in_icann or not line:
+                continue
+            rule = line.split()[0].lower()
+            PublicSuffixList._add_rule(trie, rule)
+            # Hosts may arrive punycode encoded
+            if not rule.isascii():
+                labels = rule.lstrip("!").split(".")
+                encoded = ".".join(label if label.isascii() else "xn--" + label.encode("punycode").decode("ascii")
+                                   for label in labels)
+                PublicSuffixList._add_rule(trie, ("!" if rule.startswith("!") else "") + encoded)
+        return trie
+
+    @staticmethod
+    def _add_rule(trie, rule):
+        exception = rule.startswith("!")
+        labels = rule.lstrip("!").split(".")
+        if exception:
+            labels[0] = "!" + labels[0]
+        node = trie
+        for label in reversed(labels[1:]):
+            child = node.get(label)
+            if not isinstance(child, dict):
+                child = {} if child is None else {".": 0}
+                node[label] = child
+            node = child
+        if isinstance(node.get(labels[0]), dict):
+            node[labels[0]]["."] = 0
+        else:
+            node[labels[0]] = 0
+
+    @classmethod
+    def load(cls, path=PUBLIC_SUFFIX_PATH, fallback=SYSTEM_PUBLIC_SUFFIX_LIST):
+        try:
+            with open(path) as snapshot_file:
+                data = json.load(snapshot_file)
+            if data.get("version") == cls.VERSION:
+                return cls(data["trie"])
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load public suffixes", path)
+            traceback.print_exc()
+        try:
+            with open(fallback, encoding="utf-8") as list_file:
+                return cls(cls.compile(list_file.read()))
+        except OSError:
+            print("No public suffix list found, only the top-level domains are treated as suffixes")
+            return cls()
+
+    def suffix_length(self, labels):
+        # Number of labels of the public suffix, "*" is the default rule
+        length = 1
+        depth = 0
+        node = self.trie
+        for label in reversed(labels):
+            if not isinstance(node, dict):
+                break
+            if "!" + label in node:
+                return depth
+            child = node.get(label)
+            if child is None:
+                child = node.get("*")
+                if child is None:
+                    break
+            depth += 1
+            if child == 0 or "." in child:
+                length = depth
+            node = child
+        return length
+
+    def split_host(self, host):
+        host = host.lower().rstrip(".")
+        labels = host.split(".")
+        if not host or ":" in host or (len(labels) == 4 and all(label.isdigit() for label in labels)):
+            return DomainParts("", host, "")
+        if len(labels) == 1 and host not in self.trie:
+            # Intranet host names, like localhost
+            return DomainParts("", host, "")
+        length = self.suffix_length(labels)
+        if length >= len(labels):
+            return DomainParts("", "", host)
+        return DomainParts(".".join(labels[:-length - 1]), labels[-length - 1], ".".join(labels[-length:]))
+
+    # Same fields as tldextract.extract()
+    def extract(self, url):
+        try:
+            host = urllib.parse.urlsplit(url if "://" in url else "//" + url).hostname or ""
+        except ValueError:
+            host = ""
+        return self.split_host(host)
+
+_public_suffixes = None
+_public_suffixes_lock = threading.Lock()
+
+def get_public_suffixes():
+    global _public_suffixes
+    with _public_suffixes_lock:
+        if _public_suffixes is None:
+            _public_suffixes = PublicSuffixList.load()
+        return _public_suffixes
+
+# Icon directories of the XDG icon theme specification, in lookup order
+def icon_theme_dirs():
+    dirs = [os.path.expanduser("~/.icons"),
+            os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"), "icons")]
+    for data_dir in (os.environ.get("XDG_DATA_DIRS") or "/usr/local/share:/usr/share").split(":"):
+        if data_dir:
+            dirs.append(os.path.join(data_dir, "icons"))
+    return dirs
+
+
+# Names of the icons of an icon theme, the themes it inherits from and
+# hicolor, so guessing an icon is a set lookup instead of one theme walk
+# per candidate name. The names are cached in ICON_INDEX_PATH with the
+# mtimes of every directory they were read from, and only scanned again
+# when one of those directories changed.
+class ThemeIconIndex:
+
+    VERSION = 1
+
+    def __init__(self, theme=None, search_paths=(), fallback_paths=("/usr/share/pixmaps",), cache_path=ICON_INDEX_PATH):
+        self.theme = theme or "hicolor"
+        self.search_paths = []
+        for path in list(search_paths) + icon_theme_dirs():
+            # Skip Qt resource paths
+            if not path.startswith(":") and path not in self.search_paths:
+                self.search_paths.append(path)
+        self.fallback_paths = list(fallback_paths)
+        self.cache_path = cache_path
+        self.names = frozenset()
+        self.web_names = ()
+        self.key = None
+
+    def theme_chain(self):
+        # Theme directories of the theme and its parents, hicolor last
+        chain = []
+        themes = [self.theme]
+        seen = set()
+        while themes:
+            theme = themes.pop(0)
+            if theme in seen:
+                continue
+            seen.add(theme)
+            dirs = [os.path.join(path, theme) for path in self.search_paths if os.path.isdir(os.path.join(path, theme))]
+            chain.extend(dirs)
+            for directory in dirs:
+                config = configparser.RawConfigParser(strict=False)
+                try:
+                    config.read(os.path.join(directory, "index.theme"))
+                    inherits = config.get("Icon Theme", "Inherits", fallback="")
+                except configparser.Error:
+                    continue
+                themes.extend(name.strip() for name in inherits.split(",") if name.strip())
+                break
+            if not themes and "hicolor" not in seen:
+                themes.append("hicolor")
+        return chain
+
+    def scan(self):
+        names = set()
+        stats = []
+        seen = set()
+
+        def add_directory(directory):
+            try:
+                stat = os.stat(directory)
+            except OSError:
+                return
+            if (stat.st_dev, stat.st_ino) in seen:
+                return
+            seen.add((stat.st_dev, stat.st_ino))
+            stats.append([directory, stat.st_mtime_ns])
+            try:
+                with os.scandir(directory) as it:
+                    entries = list(it)
+            except OSError:
+                return
+            for entry in entries:
+                (name, extension) = os.path.splitext(entry.name)
+                if extension in ICON_EXTENSIONS:
+                    names.add(name)
+                elif not extension and entry.is_dir():
+                    add_directory(entry.path)
+
+        for path in self.search_paths:
+            # A theme installed later changes the mtime of its search path
+            try:
+                stats.append([path, os.stat(path).st_mtime_ns])
+            except OSError:
+                stats.append([path, None])
+        for directory in self.theme_chain():
+            add_directory(directory)
+        for directory in self.fallback_paths:
+            try:
+                stats.append([directory, os.stat(directory).st_mtime_ns])
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        (name, extension) = os.path.splitext(entry.name)
+                        if extension in ICON_EXTENSIONS:
+                            names.add(name)
+            except OSError:
+                continue
+        return (names, stats)
+
+    def is_current(self, stats):
+        for directory, mtime in stats:
+            try:
+                if os.stat(directory).st_mtime_ns != mtime:
+                    return False
+            except OSError:
+                if mtime is not None:
+                    return False
+        return True
+
+    def load(self):
+        key = [self.theme, self.search_paths, self.fallback_paths]
+        if self.key == key:
+            return
+        try:
+            with open(self.cache_path) as cache_file:
+                data = json.load(cache_file)
+            if data.get("version") == self.VERSION and data.get("key") == key and self.is_current(data["stats"]):
+                self.set_names(data["names"])
+                self.key = key
+                return
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load icon index", self.cache_path)
+            traceback.print_exc()
+
+        (names, stats) = self.scan()
+        self.set_names(names)
+        self.key = key
+        try:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            tmp_path = "%s.%d.tmp" % (self.cache_path, os.getpid())
+            with open(tmp_path, "w") as cache_file:
+                json.dump({"version": self.VERSION, "key": key, "stats": stats, "names": sorted(names)}, cache_file)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            print("Could not save icon index", self.cache_path)
+            traceback.print_exc()
+
+    def set_names(self, names):
+        self.names = frozenset(names)
+        self.web_names = tuple(sorted(name for name in self.names if name.startswith("web-")))
+
+    def __contains__(self, name):
+        return name in self.names
+
+    # First of the candidate names the theme has, or None
+    def first(self, candidates):
+        for name in candidates:
+            if name and name in self.names:
+                return name
+        return None
+
+    # web-* icons matching a domain, best matches first:
+    # web-<domain>-<subdomain>, web-<domain>, web-<domain>-*, web-*-<domain>, then any web-* containing it
+    def suggest(self, domain, subdomain="", limit=ICON_SUGGESTIONS):
+        if not domain:
+            return []
+        ranked = []
+        for name in self.web_names:
+            parts = name[4:].split("-")
+            if subdomain and parts == [domain, subdomain]:
+                rank = 0
+            elif parts == [domain]:
+                rank = 1
+            elif parts[0] == domain:
+                rank = 2
+            elif parts[-1] == domain:
+                rank = 3
+            elif domain in name:
+                rank = 4
+            else:
+                continue
+            ranked.append((rank, len(name), name))
+        ranked.sort()
+        return [name for _rank, _length, name in ranked[:limit]]
+
+
+# Persistent cache of the favicon search downloads (pages and images).
+# Entries are keyed by normalized URL and keep the encoded body plus the
+# ETag/Last-Modified validators and an expiry time. Fresh entries are
+# served without touching the network, expired ones are revalidated and
+# any entry is served when the network is unavailable. The cache is kept
+# under max_bytes by evicting the least recently used entries.
+class FaviconCache:
+
+    INDEX_VERSION = 1
+
+    def __init__(self, directory=FAVICON_CACHE_DIR, max_bytes=FAVICON_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.max_bytes = max_bytes
+        self.entries = None  # key -> {"etag", "last_modified", "expires", "size", "atime"}
+        self.dirty = False
+        self.lock = threading.RLock()
+
+    @staticmethod
+    def normalize_key(url):
+        (scheme, netloc, path, params, query, _fragment) = urllib.parse.urlparse(url)
+        scheme = scheme.lower()
+        netloc = netloc.lower()
+        if (scheme, netloc.rpartition(":")[2]) in (("http", "80"), ("https", "443")):
+            netloc = netloc.rpartition(":")[0]
+        return urllib.parse.urlunparse((scheme, netloc, path or "/", params, query, ""))
+
+    def _data_path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode("utf-8")).hexdigest())
+
+    def _load(self):
+        if self.entries is not None:
+            return
+        self.entries = {}
+        try:
+            with open(self.index_path) as index_file:
+                data = json.load(index_file)
+            if data.get("version") == self.INDEX_VERSION:
+                self.entries = data["entries"]
+        except FileNotFoundError:
+            pass
+        except Exception:
+            print("Could not load favicon cache index", self.index_path)
+            traceback.print_exc()
+
+    def get(self, url):
+        # Returns (entry, content) or None
+        key = self.normalize_key(url)
+        with self.lock:
+            self._load()
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            try:
+                with open(self._data_path(key), "rb") as data_file:
+                    content = data_file.read()
+            except OSError:
+                del self.entries[key]
+                self.dirty = True
+                return None
+            entry["atime"] = time.time()
+            self.dirty = True
+            return (entry, content)
+
+    def put(self, url, headers, content):
+        expires = _http_expiry(headers)
+        if expires is None:
+            return
+        key = self.normalize_key(url)
+        with self.lock:
+            self._load()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                data_path = self._data_path(key)
+                tmp_path = "%s.%d.%d.tmp" % (data_path, os.getpid(), threading.get_ident())
+                with open(tmp_path, "wb") as data_file:
+                    data_file.write(content)
+                os.replace(tmp_path, data_path)
+            except OSError:
+                print("Could not write favicon cache entry for", url)
+                traceback.print_exc()
+                return
+            self.entries[key] = {"etag": headers.get("ETag"),
+                                 "last_modified": headers.get("Last-Modified"),
+                                 "expires": expires,
+                                 "size": len(content),
+                                 "atime": time.time()}
+            self.dirty = True
+            self._evict()
+
+    def refresh(self, url, headers):
+        # A 304 answer: the stored body is still valid, only the expiry moves
+        expires = _http_expiry(headers)
+        key = self.normalize_key(url)
+        with self.lock:
+            self._load()
+            entry = self.entries.get(key)
+            if entry is not None and expires is not None:
+                entry["expires"] = expires
+                if headers.get("ETag"):
+                    entry["etag"] = headers.get("ETag")
+                self.dirty = True
+
+    def _evict(self):
+        total = sum(entry["size"] for entry in self.entries.values())
+        if total <= self.max_bytes:
+            return
+        for key in sorted(self.entries, key=lambda key: self.entries[key]["atime"]):
+            if total <= self.max_bytes:
+                break
+            total -= self.entries.pop(key)["size"]
+            try:
+                os.remove(self._data_path(key))
+            except OSError:
+                pass
+
+    def flush(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {"version": self.INDEX_VERSION, "entries": self.entries}
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                tmp_path = "%s.%d.tmp" % (self.index_path, os.getpid())
+                with open(tmp_path, "w") as index_file:
+                    json.dump(data, index_file, separators=(",", ":"))
+                os.replace(tmp_path, self.index_path)
+                self.dirty = False
+            except OSError:
+                print("Could not save favicon cache index", self.index_path)
+                traceback.print_exc()
+
+def _http_expiry(headers):
+    # Expiry timestamp of a response, None if it must not be cached.
+    # no-store responses are still kept (expired right away) so the
+    # favicon search keeps working offline: this is a private cache.
+    now = time.time()
+    cache_control = headers.get("Cache-Control", "").lower()
+    if "no-cache" in cache_control or "no-store" in cache_control:
+        return now
+    for directive in cache_control.split(","):
+        name, _sep, value = directive.strip().partition("=")
+        if name == "max-age":
+            try:
+                return now + int(value.strip('"'))
+            except ValueError:
+                return now
+    if headers.get("Expires"):
+        try:
+            import email.utils
+            return email.utils.parsedate_to_datetime(headers["Expires"]).timestamp()
+        except (TypeError, ValueError):
+            return now
+    return now + FAVICON_CACHE_DEFAULT_TTL
+
+_http_session = None
+_http_session_lock = threading.Lock()
+_favicon_cache = FaviconCache()
+
+def get_http_session() -> "requests.Session":
+    # Shared session: keep-alive connections pooled per host, compressed responses
+    import requests
+    import requests.adapters
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=HTTP_POOL_HOSTS,
+                                                    pool_maxsize=HTTP_POOL_PER_HOST,
+                                                    pool_block=True)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            _http_session = session
+        return _http_session
+
+def http_get(url: str, timeout: float = IMAGE_TIMEOUT, max_bytes: int = PAGE_MAX_BYTES, sniff=None) -> bytes:
+    # Returns the body of url, raises on network and HTTP errors.
+    # Fresh bodies come from the favicon cache, expired ones are
+    # revalidated and served from the cache on 304 or when offline
+    # (an HTTP error such as 404 is raised, the icon is gone).
+    # The body is streamed and the download is aborted past max_bytes.
+    # sniff(content_type, first_chunk) can reject a body before it is downloaded.
+    import requests
+    cached = _favicon_cache.get(url)
+    headers = {}
+    if cached is not None:
+        (entry, content) = cached
+        if entry["expires"] > time.time():
+            return content
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    try:
+        with get_http_session().get(url, timeout=timeout, headers=headers, stream=True) as response:
+            if response.status_code == 304 and cached is not None:
+                _favicon_cache.refresh(url, response.headers)
+                return cached[1]
+            response.raise_for_status()
+            content = _read_body(response, max_bytes, sniff)
+    except (requests.ConnectionError, requests.Timeout):
+        if cached is not None:
+            return cached[1]
+        raise
+    _favicon_cache.put(url, response.headers, content)
+    return content
+
+def _read_body(response, max_bytes, sniff):
+    length = response.headers.get("Content-Length")
+    if length and length.isdigit() and int(length) > max_bytes:
+        raise ValueError("%s is too big (%s bytes)" % (response.url, length))
+    content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+    chunks = []
+    size = 0
+    for chunk in response.iter_content(chunk_size=16384):
+        if not chunks and sniff is not None:
+            sniff(content_type, chunk)
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > max_bytes:
+            raise ValueError("%s is bigger than %d bytes" % (response.url, max_bytes))
+    return b"".join(chunks)
+
+# Leading bytes of the image formats PIL can open for a favicon
+IMAGE_SIGNATURES = (
+    b"\x89PNG\r\n\x1a\n",  # PNG
+    b"\xff\xd8\xff",  # JPEG
+    b"GIF87a", b"GIF89a",  # GIF
+    b"\x00\x00\x01\x00",  # ICO
+    b"\x00\x00\x02\x00",  # CUR
+    b"BM",  # BMP
+    b"II*\x00", b"MM\x00*",  # TIFF
+)
+
+def _sniff_image(content_type, head):
+    # Servers send HTML error and login pages with a 200 status, refuse
+    # anything which neither claims to be an image nor looks like one.
+    if content_type.startswith("text/") or content_type in ("application/json", "application/xhtml+xml"):
+        raise ValueError("Not an image (%s)" % content_type)
+    if not (head.startswith(IMAGE_SIGNATURES) or (head[:4] == b"RIFF" and head[8:12] == b"WEBP")):
+        raise ValueError("Not an image (unknown signature %r)" % head[:8])
+
+def absolute_link(root_url: str, link: str) -> str:
     if "://" not in link:
         if link.startswith("/"):
             link = root_url + link
         else:
             link = root_url + "/" + link
+    return link
+
+def download_image(root_url: str, link: str, timeout: float = IMAGE_TIMEOUT) -> Optional["PIL.Image.Image"]:
+    from io import BytesIO
+    import PIL.Image
+    link = absolute_link(root_url, link)
     try:
-        response = requests.get(link, timeout=3)
-        image = PIL.Image.open(BytesIO(response.content))
-        if image.height > 256:
-            return image.resize((256, 256), PIL.Image.BICUBIC)
+        image = PIL.Image.open(BytesIO(http_get(link, timeout, IMAGE_MAX_BYTES, _sniff_image)))
+        # Let JPEG decode at a reduced scale instead of full resolution
+        image.draft(None, (FAVICON_MAX_SIZE, FAVICON_MAX_SIZE))
+        if image.width > FAVICON_MAX_SIZE or image.height > FAVICON_MAX_SIZE:
+            image.thumbnail((FAVICON_MAX_SIZE, FAVICON_MAX_SIZE), PIL.Image.BICUBIC)
         return image
     except Exception as e:
         print(e)
@@ -574,8 +2493,46 @@ def _find_google_api_favicon(_soup, iconformat, url):
     yield link
 
 
-def download_favicon(url):
+# Images found by the workers of download_favicon(). Once the deadline
+# passed the search is closed, under the same lock the images are saved
+# with, so a download finishing later never writes a file nobody reads.
+class _FaviconSearch:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.closed = False
+        self.images = {}  # candidate index -> [origin, image, path]
+
+    def add(self, index, iconformat, image):
+        with self.lock:
+            if self.closed:
+                return
+            import tempfile
+            t = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
+            image.save(t.name)
+            self.images[index] = [iconformat, image, t.name]
+
+    def close(self):
+        # Returns the images saved so far, in candidate order
+        with self.lock:
+            self.closed = True
+            return [self.images[index] for index in sorted(self.images)]
+
+def _download_favicon_candidate(root_url, iconformat, link, end_time, search, index):
+    timeout = min(IMAGE_TIMEOUT, end_time - time.monotonic())
+    if timeout <= 0:
+        return
+    image = download_image(root_url, link, timeout)
+    if image is not None:
+        search.add(index, iconformat, image)
+
+def download_favicon(url, deadline=FAVICON_DEADLINE):
+    # Returns a list of [origin, image, path], biggest images first.
+    # Candidates are downloaded concurrently and whatever arrived
+    # within `deadline` seconds is returned.
+    import concurrent.futures
     images = []
+    end_time = time.monotonic() + deadline
     url = normalize_url(url)
     (scheme, netloc, path, _, _, _) = urllib.parse.urlparse(url)
     root_url = "%s://%s" % (scheme, netloc)
@@ -583,10 +2540,10 @@ def download_favicon(url):
 
     # Check HTML and /favicon.ico
     try:
-        response = requests.get(url, timeout=3)
-        if response.ok:
+        content = http_get(url, min(IMAGE_TIMEOUT, deadline))
+        if content:
             import bs4
-            soup = bs4.BeautifulSoup(response.content, "html.parser")
+            soup = bs4.BeautifulSoup(content, "html.parser")
 
             iconformats = [
                 ("apple-touch-icon", _find_link_favicon),
@@ -601,18 +2558,31 @@ def download_favicon(url):
                 ("google-api", _find_google_api_favicon),
             ]
 
-            # icons defined in the HTML
+            # icons defined in the HTML, each link is only downloaded once
+            candidates = {}
             for (iconformat, getter) in iconformats:
                 for link in getter(soup, iconformat, api_url):
-                    image = download_image(root_url, link)
-                    if image is not None:
-                        t = tempfile.NamedTemporaryFile(suffix=".png", delete=False)
-                        image.save(t.name)
-                        images.append([iconformat, image, t.name])
+                    candidates.setdefault(absolute_link(root_url, link), iconformat)
+
+            search = _FaviconSearch()
+            executor = concurrent.futures.ThreadPoolExecutor(max_workers=FAVICON_WORKERS)
+            futures = [executor.submit(_download_favicon_candidate, root_url, iconformat, link, end_time, search, index)
+                       for index, (link, iconformat) in enumerate(candidates.items())]
+            try:
+                concurrent.futures.wait(futures, timeout=max(0, end_time - time.monotonic()))
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+                # Keep the candidates order, so equally sized icons sort like before
+                images = search.close()
+
+            unfinished = sum(1 for future in futures if not future.done())
+            if unfinished:
+                print("Favicon search for %s: dropped %d icon(s) still downloading after %ss" % (url, unfinished, deadline))
 
     except Exception as e:
         print(e)
 
+    _favicon_cache.flush()
     images = sorted(images, key = lambda x: x[1].height, reverse=True)
     return images
 
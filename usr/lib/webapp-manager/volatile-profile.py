@@ -0,0 +1,56 @@
+#!/usr/bin/python3
+# Runs a Firefox-family webapp on a copy of its profile in memory.
+#
+# Launchers of webapps with X-WebApp-Volatile=true start the browser
+# through this script:
+#   volatile-profile.py PROFILE BROWSER [ARGUMENT...]
+# The profile is copied under $XDG_RUNTIME_DIR, the browser gets the copy
+# instead of PROFILE, and the copy is synced back to PROFILE every
+# VOLATILE_SYNC_INTERVAL seconds and when the browser exits.
+
+#   1. Standard library imports.
+import os
+import signal
+import subprocess
+import sys
+
+#   3. Local application/library specific imports.
+from common import VolatileProfile, VOLATILE_SYNC_INTERVAL
+
+
+def main(argv):
+    if len(argv) < 3:
+        print("Usage: volatile-profile.py PROFILE BROWSER [ARGUMENT...]", file=sys.stderr)
+        return 2
+    profile_path, command = argv[1], argv[2:]
+    volatile = VolatileProfile(profile_path)
+    if volatile.runtime_path is None:
+        # No directory in memory, run from disk
+        os.execvp(command[0], command)
+    try:
+        volatile.acquire()
+    except BlockingIOError:
+        print("The profile %s is already in use" % profile_path, file=sys.stderr)
+        return 1
+
+    try:
+        command = [volatile.runtime_path if argument == profile_path else argument for argument in command]
+        browser = subprocess.Popen(command)
+
+        # Ending the session stops the browser, the profile is synced once it exited
+        def forward(signum, _frame):
+            browser.send_signal(signum)
+        for signum in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+            signal.signal(signum, forward)
+
+        while True:
+            try:
+                return browser.wait(VOLATILE_SYNC_INTERVAL)
+            except subprocess.TimeoutExpired:
+                volatile.sync()
+    finally:
+        volatile.release()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -1,41 +1,40 @@
 #!/usr/bin/python3
 
 #   1. Standard library imports.
+import bisect
 import gettext
+import hashlib
 import locale
 import os
 import shutil
-import subprocess
 import sys
 
 #   2. Related third party imports.
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
-    QTreeWidget, QTreeWidgetItem, QPushButton, QLineEdit, QLabel,
+    QTreeView, QAbstractItemView, QPushButton, QLineEdit, QLabel,
     QComboBox, QMessageBox, QStackedWidget, QScrollArea,
-    QCheckBox, QDialog, QDialogButtonBox, QMenuBar
+    QCheckBox, QDialog, QDialogButtonBox, QMenuBar, QFileDialog, QMenu
 )
-from PySide6.QtCore import Qt, QThread, Signal, QSize, QTranslator, QLibraryInfo
-from PySide6.QtGui import QIcon, QPixmap, QAction, QKeySequence
+from PySide6.QtCore import (
+    Qt, QThread, Signal, QSize, QTranslator, QLibraryInfo, QTimer, QObject,
+    QRunnable, QThreadPool, QAbstractItemModel, QModelIndex, QItemSelectionModel,
+    QFileSystemWatcher, QLocale, QSocketNotifier
+)
+from PySide6.QtGui import QIcon, QPixmap, QImage, QImageReader, QAction, QKeySequence, QFont
 import setproctitle
 
-try:
-    import tldextract
-    TLDEXTRACT_AVAILABLE = True
-except ImportError:
-    TLDEXTRACT_AVAILABLE = False
-
-try:
-    from PyKDE5.kdeui import KIconDialog
-    KDE_AVAILABLE = True
-except ImportError:
-    KDE_AVAILABLE = False
+# Note: PyKDE5 is imported when the icon chooser first needs it, not
+# while the main window starts.
 
 #   3. Local application/library specific imports.
 from common import (
-    WebAppManager, download_favicon, ICONS_DIR,
+    WebAppManager, ThemeIconIndex, TrashReaper, DiskUsageScanner, ProfileDeduplicator, LaunchEngine, download_favicon,
+    find_running_webapps, activate_running, ACTIVATE_LAUNCHED, ACTIVATE_RUNNING, get_public_suffixes,
+    APPS_DIR, ICONS_DIR, CACHE_DIR,
     BROWSER_TYPE_FIREFOX, BROWSER_TYPE_FIREFOX_FLATPAK,
-    BROWSER_TYPE_ZEN_FLATPAK, BROWSER_TYPE_FIREFOX_SNAP
+    BROWSER_TYPE_ZEN_FLATPAK, BROWSER_TYPE_FIREFOX_SNAP, BROWSER_TYPE_CHROMIUM, VOLATILE_BROWSER_TYPES, CHROMIUM_PRESETS,
+    ICON_SUGGESTIONS
 )
 
 setproctitle.setproctitle("webapp-manager")
@@ -48,6 +47,15 @@ gettext.bindtextdomain(APP, LOCALE_DIR)
 gettext.textdomain(APP)
 _ = gettext.gettext
 
+WATCH_DELAY = 300  # ms during which launcher file changes are collected
+LIST_ICON_SIZE = 32  # size of the webapp icons in the list
+THUMBNAILS_DIR = os.path.join(CACHE_DIR, "thumbnails")
+ICON_GUESS_DELAY = 250  # ms without typing before the URL is used to guess an icon
+DISK_USAGE_DELAY = 1000  # ms after the list changed before disk usage is measured again
+REAP_INTERVAL = 5000  # ms between checks for exited webapps, without pidfd support
+RUNNING_SCAN_INTERVAL = 3000  # ms between scans for running webapps
+RUNNING_SCAN_DELAY = 1000  # ms after a launch before its processes are looked for
+
 
 class FaviconDownloadThread(QThread):
     """Thread for downloading favicons asynchronously"""
@@ -62,6 +70,497 @@ class FaviconDownloadThread(QThread):
         self.finished.emit(images)
 
 
+class BackupThread(QThread):
+    """Thread exporting or importing a backup archive"""
+    finished = Signal(str, list)  # Emits an error message ("" on success) and the webapps
+    
+    def __init__(self, path, exporting):
+        super().__init__()
+        # Its own launcher index and writer, the window keeps using its manager meanwhile
+        self.manager = WebAppManager()
+        self.path = path
+        self.exporting = exporting
+    
+    def run(self):
+        try:
+            if self.exporting:
+                with open(self.path, "wb") as archive:
+                    compression = "xz" if self.path.endswith((".xz", ".txz")) else "gz"
+                    webapps = self.manager.export_webapps(archive, compression=compression)
+            else:
+                with open(self.path, "rb") as archive:
+                    webapps = self.manager.import_webapps(archive)
+        except Exception as e:
+            self.finished.emit(str(e), [])
+            return
+        self.finished.emit("", webapps)
+
+
+class ReaperThread(QThread):
+    """Thread freeing the disk space of deleted webapps"""
+    progress = Signal(int, int, float)  # Emits done, total and freed bytes
+    
+    def __init__(self):
+        super().__init__()
+        self.reaper = TrashReaper()
+    
+    def run(self):
+        self.reaper.reap(self.progress.emit)
+
+
+class DiskUsageThread(QThread):
+    """Thread measuring the disk usage of webapp profiles"""
+    measured = Signal(str, float)  # Emits a codename and its size in bytes
+    
+    def __init__(self, codenames, refresh):
+        super().__init__()
+        self.codenames = codenames
+        self.refresh = refresh
+        self.scanner = DiskUsageScanner()
+    
+    def run(self):
+        self.scanner.scan(self.codenames, self.measured.emit, self.refresh)
+
+
+class DedupThread(QThread):
+    """Thread sharing identical files between webapp profiles"""
+    progress = Signal(int, int)  # Emits hashed and total candidate files
+    reclaimed = Signal(float)  # Emits the bytes reclaimed
+    
+    def __init__(self, codenames):
+        super().__init__()
+        self.codenames = codenames
+        self.deduplicator = ProfileDeduplicator()
+    
+    def run(self):
+        self.reclaimed.emit(self.deduplicator.run(self.codenames, self.progress.emit))
+
+
+class RunningScanThread(QThread):
+    """Thread looking for the processes of running webapps"""
+    scanned = Signal(list)  # Emits the codenames of the running webapps
+    
+    def run(self):
+        self.scanned.emit(list(find_running_webapps()))
+
+
+class ActivateThread(QThread):
+    """Thread bringing a running webapp to the front"""
+    activated = Signal(object, int)  # Emits the webapp and an ACTIVATE_* result
+    
+    def __init__(self, webapp):
+        super().__init__()
+        self.webapp = webapp
+    
+    def run(self):
+        self.activated.emit(self.webapp, activate_running(self.webapp))
+
+
+class PruneThread(QThread):
+    """Thread moving the browser caches of webapps to the trash"""
+    pruned = Signal(int)  # Emits the number of cache directories moved
+    
+    def __init__(self, manager, webapps):
+        super().__init__()
+        self.manager = manager
+        self.webapps = webapps
+    
+    def run(self):
+        pruned = 0
+        for webapp in self.webapps:
+            try:
+                pruned += self.manager.prune_caches(webapp)
+            except OSError as e:
+                print("Could not prune the caches of", webapp.codename, e)
+        self.pruned.emit(pruned)
+
+
+class IconLoadTask(QRunnable):
+    """Load a scaled icon thumbnail, from the thumbnail cache when possible"""
+    
+    def __init__(self, loader, path, size, device_pixel_ratio):
+        super().__init__()
+        self.loader = loader
+        self.path = path
+        self.size = size
+        self.device_pixel_ratio = device_pixel_ratio
+    
+    def run(self):
+        image = QImage()
+        try:
+            stat = os.stat(self.path)
+            key = "%s\0%d\0%d\0%d\0%s" % (self.path, stat.st_mtime_ns, stat.st_size, self.size, self.device_pixel_ratio)
+            thumbnail = os.path.join(THUMBNAILS_DIR, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".png")
+            if not image.load(thumbnail):
+                image = self.decode()
+                if not image.isNull():
+                    os.makedirs(THUMBNAILS_DIR, exist_ok=True)
+                    tmp_path = "%s.%d.tmp" % (thumbnail, os.getpid())
+                    if image.save(tmp_path, "PNG"):
+                        os.replace(tmp_path, thumbnail)
+        except OSError as e:
+            print("Could not load icon", self.path, e)
+        self.loader.loaded.emit(self.path, image)
+    
+    def decode(self):
+        # Decode straight at the thumbnail size, SVG renders at that size
+        # and JPEG uses a reduced decode instead of scaling afterwards.
+        pixels = round(self.size * self.device_pixel_ratio)
+        reader = QImageReader(self.path)
+        reader.setAutoTransform(True)
+        size = reader.size()
+        if size.isValid():
+            reader.setScaledSize(size.scaled(pixels, pixels, Qt.KeepAspectRatio))
+        image = reader.read()
+        if not image.isNull() and (image.width() > pixels or image.height() > pixels):
+            image = image.scaled(pixels, pixels, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        return image
+
+
+class IconLoader(QObject):
+    """Load icon files on a thread pool, results arrive through `loaded`"""
+    loaded = Signal(str, QImage)
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.pending = set()
+        self.loaded.connect(self.on_loaded)
+    
+    def request(self, path, size, device_pixel_ratio):
+        if path in self.pending:
+            return
+        self.pending.add(path)
+        self.pool.start(IconLoadTask(self, path, size, device_pixel_ratio))
+    
+    def on_loaded(self, path, image):
+        self.pending.discard(path)
+
+
+class IconGuessTask(QRunnable):
+    """Guess a theme icon for one URL"""
+    
+    def __init__(self, guesser, url):
+        super().__init__()
+        self.guesser = guesser
+        self.url = url
+    
+    def run(self):
+        # Superseded while waiting in the queue
+        if self.url != self.guesser.latest:
+            return
+        (icon, suggestions) = self.guesser.resolve(self.url)
+        self.guesser.guessed.emit(self.url, icon, suggestions)
+
+
+class IconGuesser(QObject):
+    """Guess theme icons from URLs on a worker thread, results arrive through `guessed`
+
+    Only the latest requested URL is evaluated, and results are cached
+    per registered domain. Icon names are looked up in a ThemeIconIndex
+    of the current theme.
+    """
+    guessed = Signal(str, str, list)  # url, icon name or "", suggested web-* icons
+    
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # The theme is read here, the index is loaded by the first guess
+        self.index = ThemeIconIndex(QIcon.themeName(), QIcon.themeSearchPaths(), QIcon.fallbackSearchPaths() or ("/usr/share/pixmaps",))
+        # A single thread, so queued requests run in order and share the cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.latest = None
+        self.cache = {}  # registered domain (with subdomain for Google) -> (icon name, suggestions)
+    
+    def request(self, url):
+        self.latest = url
+        self.pool.start(IconGuessTask(self, url))
+    
+    def cancel(self):
+        self.latest = None
+    
+    def resolve(self, url):
+        info = get_public_suffixes().extract(url)
+        if not info.domain:
+            return ("", [])
+        
+        key = "%s.%s.%s" % (info.subdomain, info.domain, info.suffix) if info.domain == "google" else "%s.%s" % (info.domain, info.suffix)
+        if key in self.cache:
+            return self.cache[key]
+        
+        icon = None
+        if info.domain == "google" and info.subdomain:
+            if info.subdomain == "mail":
+                icon = "web-google-gmail"
+            else:
+                icon = f"web-{info.domain}-{info.subdomain}"
+        elif info.domain == "gmail":
+            icon = "web-google-gmail"
+        elif info.domain == "youtube":
+            icon = "web-google-youtube"
+        
+        self.index.load()
+        result = (self.index.first((icon, f"web-{info.domain}", info.domain)) or "",
+                  self.index.suggest(info.domain, info.subdomain.split(".")[-1]))
+        self.cache[key] = result
+        return result
+
+
+class WebAppListModel(QAbstractItemModel):
+    """Flat, sorted list of webapp launchers.
+
+    update_webapps() applies the difference with the previous list as
+    row insertions, moves, updates and removals, so views keep their
+    selection and scroll position and only changed rows are repainted.
+    """
+    COLUMN_ICON, COLUMN_NAME, COLUMN_BROWSER, COLUMN_SIZE = range(4)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.webapps = []
+        self.keys = []  # sort key of each row, for bisect
+        self.icons = {}  # path -> QIcon
+        self.theme_icons = {}  # theme icon name -> QIcon
+        self.file_icons = {}  # icon file path -> QIcon, once loaded
+        self.sizes = {}  # codename -> disk usage in bytes, once measured
+        self.running = frozenset()  # codenames of the running webapps
+        self.running_font = QFont()
+        self.running_font.setBold(True)
+        self.device_pixel_ratio = 1.0
+        self.icon_loader = IconLoader(self)
+        self.icon_loader.loaded.connect(self.on_icon_loaded)
+        self.sort_column = self.COLUMN_NAME
+        self.sort_order = Qt.AscendingOrder
+        self.headers = [_("Icon"), _("Name"), _("Browser"), _("Size")]
+
+    # Qt model interface
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < len(self.webapps)) or not (0 <= column < len(self.headers)):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.webapps)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.headers[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        webapp = self.webapps[index.row()]
+        column = index.column()
+        if role == Qt.UserRole:
+            return webapp
+        if role == Qt.DisplayRole:
+            if column == self.COLUMN_NAME:
+                return webapp.name
+            if column == self.COLUMN_BROWSER:
+                return webapp.web_browser or ""
+            if column == self.COLUMN_SIZE:
+                size = self.sizes.get(webapp.codename)
+                return "" if size is None else QLocale().formattedDataSize(size)
+        elif role == Qt.TextAlignmentRole and column == self.COLUMN_SIZE:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        elif role == Qt.DecorationRole and column == self.COLUMN_ICON:
+            return self.icons.get(webapp.path)
+        elif column == self.COLUMN_NAME and webapp.codename in self.running:
+            if role == Qt.DecorationRole:
+                return self.theme_icon("media-playback-start")
+            if role == Qt.FontRole:
+                return self.running_font
+            if role == Qt.ToolTipRole:
+                return _("Running")
+        return None
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+        old_persistent = self.persistentIndexList()
+        old_paths = [self.webapps[index.row()].path for index in old_persistent]
+        rows = sorted(zip(map(self.sort_key, self.webapps), self.webapps), key=lambda row: row[0])
+        self.keys = [key for key, _webapp in rows]
+        self.webapps = [webapp for _key, webapp in rows]
+        positions = {webapp.path: row for row, webapp in enumerate(self.webapps)}
+        self.changePersistentIndexList(
+            old_persistent,
+            [self.index(positions[path], index.column()) for path, index in zip(old_paths, old_persistent)])
+        self.layoutChanged.emit()
+
+    # Helpers
+
+    def sort_key(self, webapp):
+        name = (webapp.name or "").casefold()
+        if self.sort_column == self.COLUMN_BROWSER:
+            key = ((webapp.web_browser or "").casefold(), name)
+        elif self.sort_column == self.COLUMN_SIZE:
+            # Not measured yet sorts as smaller than anything
+            key = (self.sizes.get(webapp.codename, -1), name)
+        else:
+            key = (name,)
+        if self.sort_order == Qt.DescendingOrder:
+            # Invert every character so bisect can keep working on ascending keys
+            key = tuple(-part if isinstance(part, int) else tuple(-ord(char) for char in part) + (1,) for part in key)
+        return key + (webapp.path,)
+
+    def webapp_at(self, row):
+        return self.webapps[row]
+
+    def row_of(self, path):
+        for row, webapp in enumerate(self.webapps):
+            if webapp.path == path:
+                return row
+        return -1
+
+    def update_webapps(self, webapps):
+        """Apply the difference between the current rows and `webapps`"""
+        new = {webapp.path: webapp for webapp in webapps}
+
+        # Removed rows, bottom up so row numbers stay valid
+        for row in range(len(self.webapps) - 1, -1, -1):
+            if self.webapps[row].path not in new:
+                self.remove_row(row)
+
+        # New rows at once when the list is empty (first load)
+        if not self.webapps and new:
+            rows = sorted((self.sort_key(webapp), webapp) for webapp in new.values())
+            self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+            self.keys = [key for key, _webapp in rows]
+            self.webapps = [webapp for _key, webapp in rows]
+            for webapp in self.webapps:
+                self.icons[webapp.path] = self.icon_for(webapp)
+            self.endInsertRows()
+            return
+
+        current = {webapp.path: webapp for webapp in self.webapps}
+        for path, webapp in new.items():
+            if current.get(path) is not webapp:
+                self.upsert_webapp(webapp)
+
+    def upsert_webapp(self, webapp):
+        """Insert a webapp, or update the row with the same path"""
+        row = self.row_of(webapp.path)
+        if row < 0:
+            # New rows go straight to their sorted position
+            key = self.sort_key(webapp)
+            row = bisect.bisect_left(self.keys, key)
+            self.icons[webapp.path] = self.icon_for(webapp)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.webapps.insert(row, webapp)
+            self.keys.insert(row, key)
+            self.endInsertRows()
+            return
+
+        old = self.webapps[row]
+        if old is webapp or old.to_record() == webapp.to_record():
+            return
+        key = self.sort_key(webapp)
+        # The icon file may have been overwritten along with the launcher
+        self.file_icons.pop(webapp.icon, None)
+        self.icons[webapp.path] = self.icon_for(webapp)
+        self.webapps[row] = webapp
+        row = self.move_row(row, key)
+        self.dataChanged.emit(self.index(row, 0), self.index(row, len(self.headers) - 1))
+    
+    def move_row(self, row, key):
+        """Move a row to the sorted position of its new key, return its new row number"""
+        if key == self.keys[row]:
+            return row
+        # Sorted position among the other rows (the old key is still at `row`)
+        position = bisect.bisect_left(self.keys, key)
+        if position > row:
+            position -= 1
+        if position != row:
+            # Qt expects the destination as a row number before the move
+            destination = position + 1 if position > row else position
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination)
+            webapp = self.webapps.pop(row)
+            del self.keys[row]
+            self.webapps.insert(position, webapp)
+            self.keys.insert(position, key)
+            self.endMoveRows()
+            row = position
+        self.keys[row] = key
+        return row
+    
+    def set_running(self, codenames):
+        """Show which webapps are running"""
+        codenames = frozenset(codenames)
+        changed = self.running ^ codenames
+        self.running = codenames
+        for row, webapp in enumerate(self.webapps):
+            if webapp.codename in changed:
+                index = self.index(row, self.COLUMN_NAME)
+                self.dataChanged.emit(index, index)
+    
+    def set_size(self, codename, size):
+        """Show the measured disk usage of a webapp"""
+        if self.sizes.get(codename) == size:
+            return
+        self.sizes[codename] = size = int(size)
+        for row, webapp in enumerate(self.webapps):
+            if webapp.codename == codename:
+                row = self.move_row(row, self.sort_key(webapp))
+                index = self.index(row, self.COLUMN_SIZE)
+                self.dataChanged.emit(index, index)
+                return
+
+    def icon_for(self, webapp):
+        """Return the list icon of a webapp, a placeholder while its file loads"""
+        if "/" in webapp.icon:
+            icon = self.file_icons.get(webapp.icon)
+            if icon is not None:
+                return icon
+            if os.path.exists(webapp.icon):
+                self.icon_loader.request(webapp.icon, LIST_ICON_SIZE, self.device_pixel_ratio)
+            return self.theme_icon("webapp-manager")
+        icon = self.theme_icon(webapp.icon)
+        if icon.isNull():
+            icon = self.theme_icon("webapp-manager")
+        return icon
+    
+    def theme_icon(self, name):
+        icon = self.theme_icons.get(name)
+        if icon is None:
+            icon = self.theme_icons[name] = QIcon.fromTheme(name)
+        return icon
+    
+    def on_icon_loaded(self, path, image):
+        if image.isNull():
+            return
+        pixmap = QPixmap.fromImage(image)
+        pixmap.setDevicePixelRatio(self.device_pixel_ratio)
+        icon = self.file_icons[path] = QIcon(pixmap)
+        for row, webapp in enumerate(self.webapps):
+            if webapp.icon == path:
+                self.icons[webapp.path] = icon
+                index = self.index(row, self.COLUMN_ICON)
+                self.dataChanged.emit(index, index, [Qt.DecorationRole])
+
+    def remove_webapp(self, path):
+        row = self.row_of(path)
+        if row >= 0:
+            self.remove_row(row)
+
+    def remove_row(self, row):
+        self.beginRemoveRows(QModelIndex(), row, row)
+        webapp = self.webapps.pop(row)
+        del self.keys[row]
+        self.icons.pop(webapp.path, None)
+        self.endRemoveRows()
+
+
 class KIconButton(QPushButton):
     """Custom icon button that opens KIconDialog or fallback icon selector"""
     icon_changed = Signal(str)
@@ -83,7 +582,12 @@ class KIconButton(QPushButton):
         self.setIcon(icon)
     
     def choose_icon(self):
-        if KDE_AVAILABLE:
+        try:
+            from PyKDE5.kdeui import KIconDialog
+        except ImportError:
+            KIconDialog = None
+        
+        if KIconDialog is not None:
             # Use KDE's native icon chooser
             dialog = KIconDialog()
             icon_name = dialog.getIcon()
@@ -91,8 +595,7 @@ class KIconButton(QPushButton):
                 self.set_icon(icon_name)
         else:
             # Fallback: Simple file chooser
-            from PySide6.QtWidgets import QFileDialog
-            filename, _ = QFileDialog.getOpenFileName(
+            filename, _filter = QFileDialog.getOpenFileName(
                 self, _("Choose Icon"), "", 
                 "Images (*.png *.jpg *.svg);;All Files (*)"
             )
@@ -116,6 +619,42 @@ class WebAppManagerWindow(QMainWindow):
         self.selected_webapp = None
         self.edit_mode = False
         self.favicon_thread = None
+        self.backup_thread = None
+        self.reaper_thread = None
+        self.reaper_pending = False
+        self.disk_usage_thread = None
+        self.disk_usage_pending = False
+        self.disk_usage_refresh = False
+        self.prune_thread = None
+        self.dedup_thread = None
+        
+        # Launched webapps, reaped when they exit
+        self.launch_engine = LaunchEngine()
+        self.exit_notifiers = {}  # pid -> QSocketNotifier on its pidfd
+        self.reap_timer = QTimer(self)
+        self.reap_timer.setInterval(REAP_INTERVAL)
+        self.reap_timer.timeout.connect(self.reap_webapps)
+        
+        # Webapps started from the menu too, so processes are looked for regularly
+        self.running_thread = None
+        self.activate_thread = None
+        self.running_timer = QTimer(self)
+        self.running_timer.setInterval(RUNNING_SCAN_INTERVAL)
+        self.running_timer.timeout.connect(self.start_running_scan)
+        
+        # Profiles are measured once the list settled, after the first paint
+        self.disk_usage_timer = QTimer(self)
+        self.disk_usage_timer.setSingleShot(True)
+        self.disk_usage_timer.setInterval(DISK_USAGE_DELAY)
+        self.disk_usage_timer.timeout.connect(self.start_disk_usage)
+        
+        # The URL entry guesses an icon once typing pauses
+        self.icon_guesser = IconGuesser(self)
+        self.icon_guesser.guessed.connect(self.on_icon_guessed)
+        self.icon_guess_timer = QTimer(self)
+        self.icon_guess_timer.setSingleShot(True)
+        self.icon_guess_timer.setInterval(ICON_GUESS_DELAY)
+        self.icon_guess_timer.timeout.connect(self.guess_icon)
         
         self.setWindowTitle(_("Web Apps"))
         self.setWindowIcon(QIcon.fromTheme("webapp-manager"))
@@ -123,7 +662,13 @@ class WebAppManagerWindow(QMainWindow):
         
         self.setup_ui()
         self.setup_menus()
+        self.setup_watcher()
         self.load_webapps()
+        
+        # Finish deletions an earlier session did not complete
+        QTimer.singleShot(0, self.start_reaper)
+        QTimer.singleShot(0, self.start_running_scan)
+        self.running_timer.start()
     
     def setup_ui(self):
         """Create the main UI"""
@@ -183,21 +728,29 @@ class WebAppManagerWindow(QMainWindow):
         
         layout.addLayout(toolbar)
         
-        # TreeWidget for webapps
-        self.tree_widget = QTreeWidget()
-        self.tree_widget.setHeaderLabels([_("Icon"), _("Name"), _("Browser")])
-        self.tree_widget.setColumnWidth(0, 50)
-        self.tree_widget.setColumnWidth(1, 300)
-        self.tree_widget.setIconSize(QSize(32, 32))
-        self.tree_widget.setSelectionMode(QTreeWidget.SingleSelection)
-        self.tree_widget.itemSelectionChanged.connect(self.on_webapp_selected)
-        self.tree_widget.itemDoubleClicked.connect(self.on_webapp_activated)
+        # List of webapps
+        self.webapp_model = WebAppListModel(self)
+        self.tree_view = QTreeView()
+        self.tree_view.setModel(self.webapp_model)
+        self.tree_view.setRootIsDecorated(False)
+        self.tree_view.setUniformRowHeights(True)
+        self.tree_view.setColumnWidth(0, 50)
+        self.tree_view.setColumnWidth(1, 300)
+        self.tree_view.setColumnWidth(2, 150)
+        self.tree_view.setIconSize(QSize(LIST_ICON_SIZE, LIST_ICON_SIZE))
+        self.webapp_model.device_pixel_ratio = self.devicePixelRatioF()
+        self.tree_view.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.tree_view.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.tree_view.selectionModel().selectionChanged.connect(self.on_webapp_selected)
+        self.tree_view.doubleClicked.connect(self.on_webapp_activated)
+        self.tree_view.setContextMenuPolicy(Qt.CustomContextMenu)
+        self.tree_view.customContextMenuRequested.connect(self.on_webapp_context_menu)
         
         # Sort by name
-        self.tree_widget.setSortingEnabled(True)
-        self.tree_widget.sortByColumn(1, Qt.AscendingOrder)
+        self.tree_view.setSortingEnabled(True)
+        self.tree_view.sortByColumn(1, Qt.AscendingOrder)
         
-        layout.addWidget(self.tree_widget)
+        layout.addWidget(self.tree_view)
         
         return page
     
@@ -247,6 +800,16 @@ class WebAppManagerWindow(QMainWindow):
         self.icon_button = KIconButton()
         self.icon_button.icon_changed.connect(self.on_icon_changed)
         icon_layout.addWidget(self.icon_button)
+        # web-* icons of the theme matching the address
+        self.suggestion_buttons = []
+        for _index in range(ICON_SUGGESTIONS):
+            button = QPushButton()
+            button.setIconSize(QSize(32, 32))
+            button.setFlat(True)
+            button.hide()
+            button.clicked.connect(self.on_suggestion_clicked)
+            icon_layout.addWidget(button)
+            self.suggestion_buttons.append(button)
         icon_layout.addStretch()
         form_layout.addLayout(icon_layout)
         
@@ -280,6 +843,19 @@ class WebAppManagerWindow(QMainWindow):
         browser_layout.addWidget(self.browser_combo)
         form_layout.addLayout(browser_layout)
         
+        # Resource preset (Chromium)
+        preset_layout = QHBoxLayout()
+        self.preset_label = QLabel(_("Resources:"))
+        preset_layout.addWidget(self.preset_label)
+        self.preset_combo = QComboBox()
+        for preset_id, preset_name, flags in CHROMIUM_PRESETS:
+            self.preset_combo.addItem(preset_name, preset_id)
+            if flags:
+                self.preset_combo.setItemData(self.preset_combo.count() - 1, " ".join(flags), Qt.ToolTipRole)
+        self.preset_combo.setToolTip(_("Lower process and cache budgets let more Web Apps run in the same amount of memory."))
+        preset_layout.addWidget(self.preset_combo)
+        form_layout.addLayout(preset_layout)
+        
         # Custom Parameters
         custom_layout = QHBoxLayout()
         custom_layout.addWidget(QLabel(_("Custom parameters:")))
@@ -293,6 +869,7 @@ class WebAppManagerWindow(QMainWindow):
         self.isolated_checkbox.setChecked(True)
         form_layout.addWidget(self.isolated_checkbox)
         self.isolated_checkbox.setToolTip(_("If this option is enabled the website will run with its own browser profile."))
+        self.isolated_checkbox.toggled.connect(self.on_isolated_toggled)
         
         self.navbar_checkbox = QCheckBox(_("Navigation bar:"))
         form_layout.addWidget(self.navbar_checkbox)
@@ -300,6 +877,10 @@ class WebAppManagerWindow(QMainWindow):
         self.private_checkbox = QCheckBox(_("Private/Incognito Window:"))
         form_layout.addWidget(self.private_checkbox)
         
+        self.volatile_checkbox = QCheckBox(_("Profile in memory:"))
+        form_layout.addWidget(self.volatile_checkbox)
+        self.volatile_checkbox.setToolTip(_("If this option is enabled the browser profile is copied to memory while the website runs, and saved back to disk regularly and on exit."))
+        
         form_layout.addStretch()
         layout.addWidget(form_widget)
         
@@ -348,10 +929,9 @@ class WebAppManagerWindow(QMainWindow):
     def populate_browsers(self):
         """Populate browser combo box"""
         num_browsers = 0
-        for browser in self.manager.get_supported_browsers():
-            if os.path.exists(browser.test_path):
-                self.browser_combo.addItem(browser.name, browser)
-                num_browsers += 1
+        for browser in self.manager.get_installed_browsers():
+            self.browser_combo.addItem(browser.name, browser)
+            num_browsers += 1
         
         if num_browsers == 0:
             self.add_button.setEnabled(False)
@@ -368,6 +948,26 @@ class WebAppManagerWindow(QMainWindow):
         # File menu
         file_menu = menubar.addMenu(_("&File"))
         
+        export_action = QAction(_("Export Web Apps..."), self)
+        export_action.triggered.connect(self.on_export_action)
+        file_menu.addAction(export_action)
+        
+        import_action = QAction(_("Import Web Apps..."), self)
+        import_action.triggered.connect(self.on_import_action)
+        file_menu.addAction(import_action)
+        
+        file_menu.addSeparator()
+        
+        self.prune_all_action = QAction(_("Prune All Browser Caches"), self)
+        self.prune_all_action.triggered.connect(self.on_prune_all_action)
+        file_menu.addAction(self.prune_all_action)
+        
+        self.dedup_action = QAction(_("Deduplicate Profiles"), self)
+        self.dedup_action.triggered.connect(self.on_dedup_action)
+        file_menu.addAction(self.dedup_action)
+        
+        file_menu.addSeparator()
+        
         quit_action = QAction(_("Quit"), self)
         quit_action.setShortcut(QKeySequence("Ctrl+Q"))
         quit_action.triggered.connect(self.close)
@@ -386,46 +986,155 @@ class WebAppManagerWindow(QMainWindow):
         about_action.triggered.connect(self.show_about)
         help_menu.addAction(about_action)
     
-    def load_webapps(self):
-        """Load all webapps into the tree"""
-        self.tree_widget.clear()
-        self.selected_webapp = None
-        self.edit_button.setEnabled(False)
-        self.remove_button.setEnabled(False)
-        self.run_button.setEnabled(False)
+    def on_export_action(self):
+        """Export the webapps and their profiles to an archive"""
+        path, _filter = QFileDialog.getSaveFileName(
+            self, _("Export Web Apps"), os.path.expanduser("~/webapps.tar.gz"),
+            _("Backups") + " (*.tar.gz *.tar.xz)"
+        )
+        if path:
+            self.start_backup(path, True)
+    
+    def on_import_action(self):
+        """Restore webapps from an archive"""
+        path, _filter = QFileDialog.getOpenFileName(
+            self, _("Import Web Apps"), os.path.expanduser("~"),
+            _("Backups") + " (*.tar.gz *.tar.xz *.tgz *.txz)"
+        )
+        if path:
+            self.start_backup(path, False)
+    
+    def start_backup(self, path, exporting):
+        """Run an export or import in the background"""
+        if self.backup_thread is not None and self.backup_thread.isRunning():
+            return
+        self.backup_thread = BackupThread(path, exporting)
+        self.backup_thread.finished.connect(self.on_backup_finished)
+        self.backup_thread.start()
+        self.statusBar().showMessage(_("Exporting...") if exporting else _("Importing..."))
+    
+    def on_backup_finished(self, error, webapps):
+        """Report the result of an export or import"""
+        self.statusBar().clearMessage()
+        if not self.backup_thread.exporting and self.stack.currentWidget() == self.main_page:
+            # A failed import may have restored some launchers
+            self.load_webapps()
+        if error:
+            QMessageBox.warning(self, _("Web Apps"), error)
+            return
+        if self.backup_thread.exporting:
+            message = _("%d Web Apps were exported.") % len(webapps)
+        else:
+            message = _("%d Web Apps were imported.") % len(webapps)
+        QMessageBox.information(self, _("Web Apps"), message)
+    
+    def setup_watcher(self):
+        """Watch launchers written by other programs or instances"""
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_watched_directory_changed)
+        self.watcher.fileChanged.connect(self.on_watched_file_changed)
+        self.watched_targets = {}  # directory of a symlinked launcher's target -> launcher paths
+        self.pending_scan = False
+        self.pending_launchers = set()
+        
+        # Changes arriving in a burst are applied together
+        self.watch_timer = QTimer(self)
+        self.watch_timer.setSingleShot(True)
+        self.watch_timer.setInterval(WATCH_DELAY)
+        self.watch_timer.timeout.connect(self.apply_launcher_changes)
+        
+        self.watcher.addPath(APPS_DIR)
+    
+    def update_watched_paths(self):
+        """Watch each launcher file, and the directories symlinked launchers point into"""
+        paths = set(self.manager.get_launcher_paths())
+        watched = set(self.watcher.files())
+        
+        stale = watched - paths
+        if stale:
+            self.watcher.removePaths(list(stale))
+            for directory, launchers in list(self.watched_targets.items()):
+                launchers -= stale
+                if not launchers:
+                    self.watcher.removePath(directory)
+                    del self.watched_targets[directory]
+        
+        missing = paths - watched
+        if missing:
+            self.watcher.addPaths(list(missing))
+            for path in missing:
+                if os.path.islink(path):
+                    directory = os.path.dirname(os.path.realpath(path))
+                    if directory not in self.watched_targets:
+                        self.watcher.addPath(directory)
+                    self.watched_targets.setdefault(directory, set()).add(path)
+    
+    def on_watched_directory_changed(self, path):
+        """Handle a launcher added, removed or replaced"""
+        if path == APPS_DIR:
+            self.pending_scan = True
+        else:
+            self.pending_launchers.update(self.watched_targets.get(path, ()))
+        if not self.watch_timer.isActive():
+            self.watch_timer.start()
+    
+    def on_watched_file_changed(self, path):
+        """Handle a launcher modified in place"""
+        self.pending_launchers.add(path)
+        if not self.watch_timer.isActive():
+            self.watch_timer.start()
+    
+    def apply_launcher_changes(self):
+        """Re-read the launchers which changed and update their rows"""
+        if self.stack.currentWidget() != self.main_page:
+            # Going back to the main page reloads the list anyway
+            return
         
-        webapps = self.manager.get_webapps()
-        for webapp in webapps:
-            if webapp.is_valid:
-                item = QTreeWidgetItem()
-                
-                # Icon
-                if "/" in webapp.icon and os.path.exists(webapp.icon):
-                    pixmap = QPixmap(webapp.icon).scaled(32, 32, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-                    item.setIcon(0, QIcon(pixmap))
+        if self.pending_scan:
+            # Only new or modified files are parsed again
+            webapps = [webapp for webapp in self.manager.get_webapps() if webapp.is_valid]
+            self.webapp_model.update_webapps(webapps)
+        elif self.pending_launchers:
+            for path, webapp in self.manager.update_webapps(self.pending_launchers).items():
+                if webapp is None:
+                    self.webapp_model.remove_webapp(path)
                 else:
-                    icon = QIcon.fromTheme(webapp.icon)
-                    if icon.isNull():
-                        icon = QIcon.fromTheme("webapp-manager")
-                    item.setIcon(0, icon)
-                
-                item.setText(1, webapp.name)
-                item.setText(2, webapp.web_browser or "")
-                item.setData(0, Qt.UserRole, webapp)
-                
-                self.tree_widget.addTopLevelItem(item)
-        
-        # Select first item
-        if self.tree_widget.topLevelItemCount() > 0:
-            self.tree_widget.setCurrentItem(self.tree_widget.topLevelItem(0))
+                    self.webapp_model.upsert_webapp(webapp)
+        
+        # A launcher replaced by a new file lost its watch, watch it again
+        rewatch = self.pending_launchers & set(self.watcher.files())
+        if rewatch:
+            self.watcher.removePaths(list(rewatch))
+        self.pending_scan = False
+        self.pending_launchers = set()
+        self.update_watched_paths()
+        self.on_webapp_selected()
+    
+    def load_webapps(self):
+        """Bring the webapp list up to date and show the main page"""
+        webapps = [webapp for webapp in self.manager.get_webapps() if webapp.is_valid]
+        self.webapp_model.update_webapps(webapps)
+        self.pending_scan = False
+        self.pending_launchers = set()
+        self.update_watched_paths()
+        
+        # Keep the current selection, select the first item otherwise
+        if not self.tree_view.selectionModel().hasSelection() and self.webapp_model.rowCount() > 0:
+            self.tree_view.selectionModel().setCurrentIndex(
+                self.webapp_model.index(0, 0),
+                QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows
+            )
+        # The selected launcher may have been replaced by an updated one
+        self.on_webapp_selected()
+        self.disk_usage_timer.start()
         
         self.stack.setCurrentWidget(self.main_page)
     
     def on_webapp_selected(self):
         """Handle webapp selection"""
-        items = self.tree_widget.selectedItems()
-        if items:
-            self.selected_webapp = items[0].data(0, Qt.UserRole)
+        rows = self.tree_view.selectionModel().selectedRows()
+        if rows:
+            self.selected_webapp = rows[0].data(Qt.UserRole)
             self.edit_button.setEnabled(True)
             self.remove_button.setEnabled(True)
             self.run_button.setEnabled(True)
@@ -435,9 +1144,20 @@ class WebAppManagerWindow(QMainWindow):
             self.remove_button.setEnabled(False)
             self.run_button.setEnabled(False)
     
-    def on_webapp_activated(self, item, column):
+    def on_webapp_context_menu(self, position):
+        """Show the actions of the webapp under the pointer"""
+        index = self.tree_view.indexAt(position)
+        if not index.isValid():
+            return
+        menu = QMenu(self)
+        prune_action = menu.addAction(QIcon.fromTheme("edit-clear"), _("Prune Browser Caches"))
+        prune_action.setEnabled(self.prune_thread is None or not self.prune_thread.isRunning())
+        if menu.exec(self.tree_view.viewport().mapToGlobal(position)) is prune_action:
+            self.start_prune([index.data(Qt.UserRole)])
+    
+    def on_webapp_activated(self, index):
         """Handle double-click on webapp"""
-        webapp = item.data(0, Qt.UserRole)
+        webapp = index.data(Qt.UserRole)
         if webapp:
             self.run_webapp(webapp)
     
@@ -447,12 +1167,15 @@ class WebAppManagerWindow(QMainWindow):
         self.desc_entry.clear()
         self.url_entry.clear()
         self.custom_parameters_entry.clear()
+        self.cancel_icon_guess()
         self.icon_button.set_icon("webapp-manager")
         self.category_combo.setCurrentIndex(0)
         self.browser_combo.setCurrentIndex(0)
         self.isolated_checkbox.setChecked(True)
         self.navbar_checkbox.setChecked(False)
         self.private_checkbox.setChecked(False)
+        self.volatile_checkbox.setChecked(False)
+        self.preset_combo.setCurrentIndex(0)
         
         self.browser_label.show()
         self.browser_combo.show()
@@ -471,10 +1194,13 @@ class WebAppManagerWindow(QMainWindow):
         self.desc_entry.setText(self.selected_webapp.desc)
         self.url_entry.setText(self.selected_webapp.url)
         self.custom_parameters_entry.setText(self.selected_webapp.custom_parameters)
+        self.cancel_icon_guess()
         self.icon_button.set_icon(self.selected_webapp.icon)
         self.navbar_checkbox.setChecked(self.selected_webapp.navbar)
         self.isolated_checkbox.setChecked(self.selected_webapp.isolate_profile)
         self.private_checkbox.setChecked(self.selected_webapp.privatewindow)
+        self.volatile_checkbox.setChecked(self.selected_webapp.volatile)
+        self.preset_combo.setCurrentIndex(max(self.preset_combo.findData(self.selected_webapp.preset), 0))
         
         # Set browser
         for i in range(self.browser_combo.count()):
@@ -513,6 +1239,124 @@ class WebAppManagerWindow(QMainWindow):
         if reply == QMessageBox.Yes:
             self.manager.delete_webbapp(self.selected_webapp)
             self.load_webapps()
+            self.start_reaper()
+    
+    def start_reaper(self):
+        """Free the disk space of deleted webapps in the background"""
+        if self.reaper_thread is not None and self.reaper_thread.isRunning():
+            # It runs again once done, for what was deleted meanwhile
+            self.reaper_pending = True
+            return
+        self.reaper_pending = False
+        if not TrashReaper().pending():
+            return
+        self.reaper_thread = ReaperThread()
+        self.reaper_thread.progress.connect(self.on_reaper_progress)
+        self.reaper_thread.finished.connect(self.on_reaper_finished)
+        self.reaper_thread.start()
+    
+    def start_disk_usage(self, refresh=False):
+        """Measure the disk usage of the webapps in the background"""
+        self.disk_usage_refresh = self.disk_usage_refresh or refresh
+        if self.disk_usage_thread is not None and self.disk_usage_thread.isRunning():
+            # It runs again once done, for what changed meanwhile
+            self.disk_usage_pending = True
+            return
+        self.disk_usage_pending = False
+        codenames = [self.webapp_model.webapp_at(row).codename for row in range(self.webapp_model.rowCount())]
+        self.disk_usage_thread = DiskUsageThread(codenames, self.disk_usage_refresh)
+        self.disk_usage_refresh = False
+        self.disk_usage_thread.measured.connect(self.webapp_model.set_size)
+        self.disk_usage_thread.finished.connect(self.on_disk_usage_finished)
+        self.disk_usage_thread.start()
+    
+    def on_disk_usage_finished(self):
+        """Measure again if the list changed meanwhile"""
+        if self.disk_usage_pending:
+            self.start_disk_usage()
+    
+    def on_dedup_action(self):
+        """Share identical files between the webapp profiles"""
+        if self.dedup_thread is not None and self.dedup_thread.isRunning():
+            return
+        self.dedup_action.setEnabled(False)
+        self.statusBar().showMessage(_("Deduplicating profiles..."))
+        codenames = [self.webapp_model.webapp_at(row).codename for row in range(self.webapp_model.rowCount())]
+        self.dedup_thread = DedupThread(codenames)
+        self.dedup_thread.progress.connect(self.on_dedup_progress)
+        self.dedup_thread.reclaimed.connect(self.on_dedup_finished)
+        self.dedup_thread.start()
+    
+    def on_dedup_progress(self, done, total):
+        """Show the progress of the deduplication"""
+        self.statusBar().showMessage(_("Deduplicating profiles: %(done)d of %(total)d files") % {"done": done, "total": total})
+    
+    def on_dedup_finished(self, reclaimed):
+        """Report the space reclaimed, the shares of the profiles changed"""
+        self.dedup_action.setEnabled(True)
+        self.statusBar().showMessage(_("Deduplicating profiles reclaimed %s.") % QLocale().formattedDataSize(int(reclaimed)), 5000)
+        if reclaimed:
+            self.start_disk_usage(refresh=True)
+    
+    def on_prune_all_action(self):
+        """Prune the browser caches of every webapp"""
+        self.start_prune([self.webapp_model.webapp_at(row) for row in range(self.webapp_model.rowCount())])
+    
+    def start_prune(self, webapps):
+        """Move browser caches to the trash in the background"""
+        if self.prune_thread is not None and self.prune_thread.isRunning():
+            return
+        self.prune_all_action.setEnabled(False)
+        self.statusBar().showMessage(_("Pruning browser caches..."))
+        self.prune_thread = PruneThread(self.manager, webapps)
+        self.prune_thread.pruned.connect(self.on_pruned)
+        self.prune_thread.start()
+    
+    def on_pruned(self, pruned):
+        """Free the space of the pruned caches and measure the profiles again"""
+        self.prune_all_action.setEnabled(True)
+        self.statusBar().clearMessage()
+        if pruned:
+            self.start_reaper()
+            self.start_disk_usage()
+        else:
+            self.statusBar().showMessage(_("No browser caches to prune."), 5000)
+    
+    def on_reaper_progress(self, done, total, freed):
+        """Show the progress of the reaper"""
+        self.statusBar().showMessage(
+            _("Removing deleted Web Apps: %(done)d of %(total)d (%(freed)s freed)") %
+            {"done": done, "total": total, "freed": QLocale().formattedDataSize(int(freed))}
+        )
+    
+    def on_reaper_finished(self):
+        """Clear the progress, and start again if webapps were deleted meanwhile"""
+        self.statusBar().clearMessage()
+        if self.reaper_pending and not self.reaper_thread.reaper.cancelled:
+            self.start_reaper()
+        elif self.reaper_thread.reaper.freed:
+            # Files the deleted profiles shared with others now count for fewer links
+            self.start_disk_usage(refresh=True)
+    
+    def closeEvent(self, event):
+        """Stop the background threads, the next start resumes the reaper"""
+        if self.reaper_thread is not None and self.reaper_thread.isRunning():
+            self.reaper_thread.reaper.cancel()
+            self.reaper_thread.wait()
+        if self.disk_usage_thread is not None:
+            self.disk_usage_thread.scanner.cancel()
+            self.disk_usage_thread.wait()
+        if self.prune_thread is not None:
+            self.prune_thread.wait()
+        if self.dedup_thread is not None:
+            self.dedup_thread.deduplicator.cancel()
+            self.dedup_thread.wait()
+        self.running_timer.stop()
+        if self.running_thread is not None:
+            self.running_thread.wait()
+        if self.activate_thread is not None:
+            self.activate_thread.wait()
+        super().closeEvent(event)
     
     def on_run_button(self):
         """Run selected webapp"""
@@ -520,11 +1364,63 @@ class WebAppManagerWindow(QMainWindow):
             self.run_webapp(self.selected_webapp)
     
     def run_webapp(self, webapp):
-        """Execute a webapp"""
-        if webapp:
-            print(f"Running {webapp.path}")
-            print(f"Executing {webapp.exec}")
-            subprocess.Popen(webapp.exec, shell=True)
+        """Execute a webapp, or bring it to the front when it runs"""
+        if not webapp:
+            return
+        if webapp.codename not in self.webapp_model.running:
+            self.launch_webapp(webapp)
+            return
+        if self.activate_thread is not None and self.activate_thread.isRunning():
+            return
+        self.activate_thread = ActivateThread(webapp)
+        self.activate_thread.activated.connect(self.on_activated)
+        self.activate_thread.start()
+    
+    def on_activated(self, webapp, result):
+        """Launch the webapp unless its running window was handled"""
+        if result == ACTIVATE_LAUNCHED:
+            self.launch_webapp(webapp)
+        elif result == ACTIVATE_RUNNING:
+            self.statusBar().showMessage(_("'%s' is already running.") % webapp.name, 5000)
+    
+    def launch_webapp(self, webapp):
+        """Start a webapp and watch for its exit"""
+        try:
+            launch = self.launch_engine.launch(webapp)
+        except OSError as e:
+            QMessageBox.warning(self, _("Web Apps"), _("Could not launch '%(name)s': %(error)s") %
+                                {"name": webapp.name, "error": e.strerror or e})
+            return
+        print(f"Launched {webapp.path} (pid {launch.pid}) in {launch.latency * 1000:.2f} ms: {launch.argv}")
+        QTimer.singleShot(RUNNING_SCAN_DELAY, self.start_running_scan)
+        
+        pidfd = self.launch_engine.pidfd(launch.pid)
+        if pidfd >= 0:
+            notifier = QSocketNotifier(pidfd, QSocketNotifier.Read, self)
+            notifier.activated.connect(self.reap_webapps)
+            self.exit_notifiers[launch.pid] = notifier
+        elif not self.reap_timer.isActive():
+            self.reap_timer.start()
+    
+    def reap_webapps(self):
+        """Collect the exit status of the webapps which exited"""
+        for launch, status in self.launch_engine.reap():
+            notifier = self.exit_notifiers.pop(launch.pid, None)
+            if notifier is not None:
+                notifier.setEnabled(False)
+                notifier.deleteLater()
+            print(f"{launch.codename} (pid {launch.pid}) exited with status {status}")
+        if len(self.exit_notifiers) == len(self.launch_engine.children):
+            self.reap_timer.stop()
+        self.start_running_scan()
+    
+    def start_running_scan(self):
+        """Look for running webapps in the background"""
+        if self.running_thread is not None and self.running_thread.isRunning():
+            return
+        self.running_thread = RunningScanThread()
+        self.running_thread.scanned.connect(self.webapp_model.set_running)
+        self.running_thread.start()
     
     def on_ok_button(self):
         """Save webapp"""
@@ -536,6 +1432,8 @@ class WebAppManagerWindow(QMainWindow):
         isolate_profile = self.isolated_checkbox.isChecked()
         navbar = self.navbar_checkbox.isChecked()
         privatewindow = self.private_checkbox.isChecked()
+        volatile = self.volatile_checkbox.isChecked()
+        preset = self.preset_combo.currentData()
         icon = self.icon_button.get_icon()
         custom_parameters = self.custom_parameters_entry.text()
         
@@ -550,12 +1448,12 @@ class WebAppManagerWindow(QMainWindow):
             self.manager.edit_webapp(
                 self.selected_webapp.path, name, desc, browser, url, icon,
                 category, custom_parameters, self.selected_webapp.codename,
-                isolate_profile, navbar, privatewindow
+                isolate_profile, navbar, privatewindow, volatile, preset
             )
         else:
             self.manager.create_webapp(
                 name, desc, url, icon, category, browser, custom_parameters,
-                isolate_profile, navbar, privatewindow
+                isolate_profile, navbar, privatewindow, volatile, preset
             )
         
         self.load_webapps()
@@ -628,6 +1526,11 @@ class WebAppManagerWindow(QMainWindow):
         """Handle browser selection change"""
         self.show_hide_browser_widgets()
     
+    def on_isolated_toggled(self, checked):
+        """Resource presets only apply to isolated profiles"""
+        self.preset_label.setEnabled(checked)
+        self.preset_combo.setEnabled(checked)
+    
     def show_hide_browser_widgets(self):
         """Show/hide widgets based on browser type"""
         browser = self.browser_combo.currentData()
@@ -642,6 +1545,9 @@ class WebAppManagerWindow(QMainWindow):
         self.isolated_checkbox.setVisible(not is_firefox)
         self.navbar_checkbox.setVisible(is_firefox)
         self.private_checkbox.setVisible(True)
+        self.volatile_checkbox.setVisible(browser.browser_type in VOLATILE_BROWSER_TYPES)
+        self.preset_label.setVisible(browser.browser_type == BROWSER_TYPE_CHROMIUM)
+        self.preset_combo.setVisible(browser.browser_type == BROWSER_TYPE_CHROMIUM)
     
     def on_name_entry_changed(self):
         """Handle name entry change"""
@@ -652,7 +1558,7 @@ class WebAppManagerWindow(QMainWindow):
         url = self.get_url()
         self.favicon_button.setEnabled(bool(url))
         self.toggle_ok_sensitivity()
-        self.guess_icon()
+        self.icon_guess_timer.start()
     
     def on_icon_changed(self, icon):
         """Handle icon change"""
@@ -675,30 +1581,36 @@ class WebAppManagerWindow(QMainWindow):
     def guess_icon(self):
         """Try to guess icon from URL"""
         url = self.get_url().lower()
-        if not url:
-            return
-        
-        info = tldextract.extract(url)
-        if not info.domain:
+        if url:
+            self.icon_guesser.request(url)
+    
+    def on_icon_guessed(self, url, icon, suggestions):
+        """Apply a guessed icon, unless the URL changed in the meantime"""
+        if url != self.icon_guesser.latest or url != self.get_url().lower():
             return
-        
-        icon = None
-        if info.domain == "google" and info.subdomain:
-            if info.subdomain == "mail":
-                icon = "web-google-gmail"
-            else:
-                icon = f"web-{info.domain}-{info.subdomain}"
-        elif info.domain == "gmail":
-            icon = "web-google-gmail"
-        elif info.domain == "youtube":
-            icon = "web-google-youtube"
-        
-        if icon and not QIcon.fromTheme(icon).isNull():
+        if icon:
             self.icon_button.set_icon(icon)
-        elif not QIcon.fromTheme(f"web-{info.domain}").isNull():
-            self.icon_button.set_icon(f"web-{info.domain}")
-        elif not QIcon.fromTheme(info.domain).isNull():
-            self.icon_button.set_icon(info.domain)
+        self.show_icon_suggestions(suggestions)
+    
+    def show_icon_suggestions(self, suggestions):
+        """Show the suggested icons next to the icon button"""
+        for index, button in enumerate(self.suggestion_buttons):
+            if index < len(suggestions):
+                button.setIcon(QIcon.fromTheme(suggestions[index]))
+                button.setToolTip(suggestions[index])
+                button.show()
+            else:
+                button.hide()
+    
+    def on_suggestion_clicked(self):
+        """Use a suggested icon"""
+        self.icon_button.set_icon(self.sender().toolTip())
+    
+    def cancel_icon_guess(self):
+        """Drop pending guesses, so they don't replace an icon set by the form"""
+        self.icon_guess_timer.stop()
+        self.icon_guesser.cancel()
+        self.show_icon_suggestions([])
     
     def show_shortcuts(self):
         """Show keyboard shortcuts dialog"""